@@ -1,9 +1,16 @@
 # analyzer.py
 from __future__ import annotations
 
-import time, re
+import time, re, threading
 from typing import Tuple, Optional
 
+# Import al cargar el módulo (no hay ciclo real con models); si alguna vez
+# lo hubiera, se resuelve perezosamente en detect_all.
+try:
+    from models import TramoNorm
+except ImportError:
+    TramoNorm = None
+
 # Export explícito para evitar sorpresas con imports desde la GUI
 __all__ = [
     "TrafficDetector",
@@ -13,26 +20,54 @@ __all__ = [
     "shutdown_detectors",
 ]
 
+# ===================== Regex precompilados =====================
+# Compilados una sola vez: el parseo corre por cada tramo de cada captura.
+# Un solo patrón con grupos nombrados: una pasada del motor saca minutos,
+# velocidad y distancia juntos (el alternador km/?h va antes que km suelto).
+_RE_ALL = re.compile(
+    r"(?P<min>\d+)\s*min(?:utos)?\b"
+    r"|(?P<kmh>[\d.,]+)\s*km/?h"
+    r"|(?P<km>[\d.,]+)\s*km\b",
+    re.I,
+)
+_RE_JAM = re.compile(r"jam-level-(\d)")
+
+
 # ===================== Estado global =====================
 _LAST_DRIVER = None          # driver Selenium más reciente
 _GLOBAL_DETECTORS = set()    # detectores vivos (para cerrarlos desde GUI)
 _DETECTOR_SINGLETON = None   # se reutiliza entre llamadas GUI
 
 
+def _safe_close(det):
+    try:
+        det.close()
+    except Exception:
+        pass
+
+
 def shutdown_detectors():
     """
     Cierra todos los detectores vivos (y sus Chrome/Drivers).
-    Idempotente y segura.
+    Idempotente y segura. Los quit() (1–3 s cada uno) corren en paralelo:
+    cada cierre es matar un subproceso independiente.
     """
-    for det in list(_GLOBAL_DETECTORS):
-        try:
-            det.close()
-        except Exception:
-            pass
+    vivos = list(_GLOBAL_DETECTORS)
+    if not vivos:
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(8, len(vivos))) as ex:
+        list(ex.map(_safe_close, vivos))
 
 
 # ===================== Selenium (import diferido) =====================
+_SEL_BITS = None  # memoizado: se importa una sola vez por proceso
+
+
 def _get_selenium_bits():
+    global _SEL_BITS
+    if _SEL_BITS is not None:
+        return _SEL_BITS
     try:
         from selenium import webdriver
         from selenium.webdriver.chrome.options import Options
@@ -40,13 +75,94 @@ def _get_selenium_bits():
         from selenium.webdriver.support.ui import WebDriverWait
         from selenium.webdriver.support import expected_conditions as EC
         from selenium.common.exceptions import TimeoutException, JavascriptException
-        return webdriver, Options, By, WebDriverWait, EC, TimeoutException, JavascriptException
+        _SEL_BITS = (webdriver, Options, By, WebDriverWait, EC, TimeoutException, JavascriptException)
+        return _SEL_BITS
     except Exception as e:
         raise RuntimeError(
             "No se pudo importar Selenium. Instala en el venv: pip install selenium"
         ) from e
 
 
+# ===================== CDP (WebSocket persistente) =====================
+def _get_ws_bits():
+    """Importa websocket-client de forma diferida (viene con Selenium 4)."""
+    try:
+        from websocket import create_connection
+        return create_connection
+    except Exception:
+        return None
+
+
+class _CDPHub:
+    """
+    UN WebSocket CDP por navegador (debuggerAddress), multiplexado por
+    sessionId (Target.attachToTarget con flatten). Si varios detectores
+    comparten el mismo Chrome, comparten también el socket: sus comandos
+    se encolan por el mismo canal en vez de abrir N conexiones.
+    """
+    _hubs: dict = {}
+    _hubs_lock = threading.Lock()
+
+    def __init__(self, addr: str):
+        import json
+        from urllib.request import urlopen
+        create_connection = _get_ws_bits()
+        if create_connection is None:
+            raise RuntimeError("websocket-client no disponible")
+        info = json.loads(urlopen(f"http://{addr}/json/version", timeout=5).read())
+        self._ws = create_connection(info["webSocketDebuggerUrl"], timeout=15)
+        self._lock = threading.Lock()
+        self._id = 0
+        self._addr = addr
+        self._users = 0
+
+    @classmethod
+    def for_address(cls, addr: str) -> "_CDPHub":
+        with cls._hubs_lock:
+            hub = cls._hubs.get(addr)
+            if hub is None:
+                hub = cls(addr)
+                cls._hubs[addr] = hub
+            hub._users += 1
+            return hub
+
+    def release(self):
+        with self._hubs_lock:
+            self._users -= 1
+            if self._users <= 0:
+                self._hubs.pop(self._addr, None)
+                try:
+                    self._ws.close()
+                except Exception:
+                    pass
+
+    def send(self, method: str, params: dict = None, session_id: str = None) -> dict:
+        """Envía un comando y espera su respuesta (los eventos se descartan)."""
+        import json
+        with self._lock:
+            self._id += 1
+            msg_id = self._id
+            msg = {"id": msg_id, "method": method, "params": params or {}}
+            if session_id:
+                msg["sessionId"] = session_id
+            self._ws.send(json.dumps(msg))
+            while True:
+                resp = json.loads(self._ws.recv())
+                if resp.get("id") == msg_id:
+                    if "error" in resp:
+                        raise RuntimeError(str(resp["error"]))
+                    return resp.get("result", {})
+
+    def attach_first_page(self) -> str:
+        """Se adjunta a la primera pestaña tipo 'page' y devuelve su sessionId."""
+        targets = self.send("Target.getTargets").get("targetInfos", [])
+        page = next(t for t in targets if t.get("type") == "page")
+        return self.send(
+            "Target.attachToTarget",
+            {"targetId": page["targetId"], "flatten": True},
+        )["sessionId"]
+
+
 # ===================== Driver =====================
 def _build_driver(cfg):
     webdriver, Options, *_ = _get_selenium_bits()
@@ -68,7 +184,21 @@ def _build_driver(cfg):
 
     opts.add_argument("--disable-dev-shm-usage")
     opts.add_argument("--no-sandbox")
-    return webdriver.Chrome(options=opts)
+    # Solo leemos texto del DOM: sin imágenes ni features que compiten por
+    # ancho de banda/CPU, el panel aparece antes.
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_argument("--disable-features=Translate,BackForwardCache")
+    driver = webdriver.Chrome(options=opts)
+    # Bloquear recursos pesados (tiles del mapa, fuentes, media) vía CDP
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": [
+            "*.png", "*.jpg", "*.jpeg", "*.webp",
+            "*.woff*", "*.mp4", "*tiles*",
+        ]})
+    except Exception:
+        pass
+    return driver
 
 
 def _esperar_panel(driver, timeout=30):
@@ -78,220 +208,192 @@ def _esperar_panel(driver, timeout=30):
     )
 
 
+# Busca el chip y lo clica en un solo eval: una llamada al driver por sondeo
+# en vez de find_elements + find_element por chip (N round-trips por pasada).
+_JS_CLIC_CHIP = r"""
+const chips = document.querySelectorAll('wz-checkable-chip');
+for (const c of chips){
+  const t = ((c.querySelector('.chip-content') || {}).innerText || '').trim();
+  if (/Traffic|Vista de tráfico/i.test(t)){
+    try { c.click(); } catch(e){}
+    return true;
+  }
+}
+return false;
+"""
+
+
 def _activar_traffic_view(driver, log):
-    _, _, By, _, _, TimeoutException, _ = _get_selenium_bits()
+    _, _, _, WebDriverWait, _, TimeoutException, _ = _get_selenium_bits()
     log("⏳ Buscando chip 'Traffic View'…")
-    for _ in range(60):
-        try:
-            chips = driver.find_elements(By.TAG_NAME, "wz-checkable-chip")
-            for chip in chips:
-                try:
-                    contenido = chip.find_element(By.CLASS_NAME, "chip-content").text.strip()
-                except Exception:
-                    continue
-                if any(k in contenido for k in ("Traffic", "Vista de tráfico", "Traffic View")):
-                    try:
-                        chip.click()
-                    except Exception:
-                        pass
-                    log("✅ Chip 'Traffic View' activado.")
-                    try:
-                        _esperar_panel(driver, timeout=30)
-                    except TimeoutException:
-                        pass
-                    return
-        except Exception:
-            pass
-        time.sleep(1)
-    raise RuntimeError("No se encontró el botón de Traffic View en 60 s")
+    try:
+        WebDriverWait(driver, 60, poll_frequency=0.5).until(
+            lambda d: d.execute_script(_JS_CLIC_CHIP)
+        )
+    except TimeoutException:
+        raise RuntimeError("No se encontró el botón de Traffic View en 60 s")
+    log("✅ Chip 'Traffic View' activado.")
+    try:
+        _esperar_panel(driver, timeout=30)
+    except TimeoutException:
+        pass
 
 
 # ===================== Scroll & extracción =====================
-def _js_get_scrollable_container(driver):
-    # Evita “return ( ... );” y maneja fallback
-    script = r"""
-return (function(){
+# Cachea el contenedor scrollable en la página (window.__wazeScrollEl) para que
+# los comandos de scroll sean expresiones fijas evaluables por Runtime.evaluate
+# (el WS de CDP no puede pasar handles de elementos como execute_script).
+# Memoizado: en una SPA el contenedor no cambia entre capturas, así que las
+# llamadas siguientes salen por el early-return; refresh/navegación limpian
+# window.* y fuerzan un re-probe solo cuando de verdad hizo falta.
+_JS_PREPARAR_SCROLL = r"""(function(){
+  if (window.__wazeScrollEl && window.__wazeScrollEl.isConnected && window.__wazeWait) return true;
   const first = document.querySelector('app-traffic-view-route');
   function getScrollable(el){
     let n = el;
     while (n && !(n.scrollHeight > n.clientHeight)) n = n.parentElement;
     return n || document.scrollingElement;
   }
-  return first ? getScrollable(first) : document.scrollingElement;
-})();
-"""
-    try:
-        return driver.execute_script(script)
-    except Exception:
+  window.__wazeScrollEl = first ? getScrollable(first) : document.scrollingElement;
+  // Espera dirigida por eventos: resuelve en cuanto el DOM muta (lista creció)
+  // o al vencer el tope, en vez de dormir un tiempo fijo por scroll.
+  window.__wazeWait = (cap) => new Promise((res) => {
+    const t = setTimeout(() => { obs.disconnect(); res('timeout'); }, cap || 400);
+    const obs = new MutationObserver(() => {
+      clearTimeout(t); obs.disconnect(); res('mutated');
+    });
+    obs.observe(document.body, {subtree: true, childList: true});
+  });
+  return !!window.__wazeScrollEl;
+})()"""
+
+_JS_EL = "(window.__wazeScrollEl || document.scrollingElement)"
+
+# Sacudida final sincronizada al paint: dos requestAnimationFrame (<16 ms
+# típico) en lugar de ~220 ms de sleeps fijos ciegos al estado del navegador.
+_JS_SACUDIDA = f"""(async function(){{
+  const el = {_JS_EL};
+  const settle = () => new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r)));
+  el.scrollTop = Math.max(0, el.scrollTop - 200);
+  await settle();
+  el.scrollTop = el.scrollHeight;
+  await settle();
+  return true;
+}})()"""
+
+_JS_HEIGHT = f"{_JS_EL}.scrollHeight"
+_JS_RETROCEDER = f"{_JS_EL}.scrollTop = Math.max(0, {_JS_EL}.scrollTop - 50)"
+_JS_CONTAR = "document.querySelectorAll('app-traffic-view-route').length"
+
+# Un tick de scroll completo en una sola evaluación: hace el scroll y
+# devuelve [scrollHeight, nº de rutas, scrollTop, clientHeight] — 1 round-trip.
+_JS_TICK = f"""(function(){{
+  const e = {_JS_EL};
+  e.scrollBy(0, 600);
+  return [e.scrollHeight, {_JS_CONTAR}, e.scrollTop, e.clientHeight];
+}})()"""
+
+
+def _cdp_cmd_eval(driver, expr, await_promise=False):
+    """
+    Runtime.evaluate vía el canal CDP que Selenium 4 mantiene abierto
+    (execute_cdp_cmd): evita el endpoint W3C de execute_script.
+    """
+    res = driver.execute_cdp_cmd("Runtime.evaluate", {
+        "expression": expr,
+        "returnByValue": True,
+        "awaitPromise": bool(await_promise),
+    })
+    return res.get("result", {}).get("value")
+
+
+def _default_evaluar(driver):
+    """Evaluador por defecto: execute_cdp_cmd, y execute_script de respaldo."""
+    def evaluar(expr, await_promise=False):
         try:
-            return driver.execute_script("return document.scrollingElement;")
+            return _cdp_cmd_eval(driver, expr, await_promise)
         except Exception:
-            return None
+            pass
+        if await_promise:
+            return driver.execute_async_script(
+                "const done = arguments[arguments.length-1];"
+                f"Promise.resolve({expr}).then(done, () => done(null));"
+            )
+        return driver.execute_script(f"return ({expr});")
+    return evaluar
 
 
-def _cargar_lista_completa(driver, log, max_scrolls=400, pause=0.18):
+def _esperar_mutacion(evaluar, pause):
+    """
+    Espera a que el DOM mute (o 400 ms de tope) tras un scroll. Si la señal
+    no está disponible, vuelve al sleep fijo anterior.
+    """
+    try:
+        res = evaluar("window.__wazeWait ? window.__wazeWait(400) : null",
+                      await_promise=True)
+    except Exception:
+        res = None
+    if res is None:
+        time.sleep(pause)
+
+
+def _cargar_lista_completa(driver, log, pause=0.18, evaluar=None):
     _, _, By, WebDriverWait, EC, _, _ = _get_selenium_bits()
     WebDriverWait(driver, 20).until(
         EC.visibility_of_element_located((By.CSS_SELECTOR, "app-traffic-view-route"))
     )
+    if evaluar is None:
+        evaluar = _default_evaluar(driver)
 
-    def contar():
-        return driver.execute_script("return document.querySelectorAll('app-traffic-view-route').length;")
-
-    last_count = -1
-    same = 0
-    scrollable = _js_get_scrollable_container(driver)
-    if scrollable is None:
-        scroll_cmd = "window.scrollBy(0, 600);"
-        height_cmd = "return document.scrollingElement.scrollHeight;"
-        get_top_cmd = "return document.scrollingElement.scrollTop;"
-        set_top_cmd = "document.scrollingElement.scrollTop = arguments[0];"
-    else:
-        scroll_cmd = "arguments[0].scrollBy(0, 600);"
-        height_cmd = "return arguments[0].scrollHeight;"
-        get_top_cmd = "return arguments[0].scrollTop;"
-        set_top_cmd = "arguments[0].scrollTop = arguments[1];"
-
-    prev_h = driver.execute_script(height_cmd, scrollable) if scrollable else driver.execute_script(height_cmd)
-    for _ in range(max_scrolls):
-        if scrollable:
-            driver.execute_script(scroll_cmd, scrollable)
-        else:
-            driver.execute_script(scroll_cmd)
-        time.sleep(pause)
-        new_h = driver.execute_script(height_cmd, scrollable) if scrollable else driver.execute_script(height_cmd)
+    try:
+        evaluar(_JS_PREPARAR_SCROLL)
+    except Exception:
+        pass  # los comandos caen solos a document.scrollingElement
+
+    # Paro por convergencia: ventana de los últimos 4 conteos sin crecimiento
+    # + llegar al fondo, dos veces seguidas. Sin tope fijo de 400 scrolls:
+    # listas cortas terminan antes y largas no se truncan (tope blando que
+    # crece con el conteo observado).
+    buf = []
+    stable = 0
+    iters = 0
+    prev_h = evaluar(_JS_HEIGHT) or 0
+    while True:
+        new_h, count, top, client_h = evaluar(_JS_TICK) or (0, 0, 0, 0)
+        _esperar_mutacion(evaluar, pause)
         if new_h <= prev_h:
-            top = driver.execute_script(get_top_cmd, scrollable) if scrollable else driver.execute_script(get_top_cmd)
-            if scrollable:
-                driver.execute_script(set_top_cmd, scrollable, max(0, top - 50))
-            else:
-                driver.execute_script(set_top_cmd, max(0, top - 50))
+            evaluar(_JS_RETROCEDER)
             time.sleep(0.05)
         prev_h = new_h
-        count = contar()
-        if count == last_count:
-            same += 1
+
+        buf.append(count)
+        if len(buf) > 4:
+            buf.pop(0)
+        fondo = top + client_h >= new_h - 2
+        if len(buf) >= 2 and count - min(buf) == 0 and fondo:
+            stable += 1
+            if stable >= 2:
+                break
         else:
-            same = 0
-        last_count = count
-        if same >= 2:
+            stable = 0
+        iters += 1
+        if iters >= max(60, count * 3):
             break
 
-    # Sacudida final
-    if scrollable:
-        driver.execute_script("arguments[0].scrollTop = Math.max(0, arguments[0].scrollTop - 200);", scrollable)
-        time.sleep(0.07)
-        driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight;", scrollable)
-    else:
-        driver.execute_script("document.scrollingElement.scrollTop = Math.max(0, document.scrollingElement.scrollTop - 200);")
-        time.sleep(0.07)
-        driver.execute_script("document.scrollingElement.scrollTop = document.scrollingElement.scrollHeight;")
-    time.sleep(0.15)
-
-def _js_extraer_tramos(driver):
-    """
-    Extracción principal. Además de textos, determina la sección del panel
-    (Unusual/Watchlist) y la embebe como `section_flag` ('unusual' | 'watch' | '').
-    Regla pedida:
-      - WATCHLIST  = tarjeta con menú de acciones (route-menu con Edit/Delete)
-      - INUSUAL    = SIN menú de acciones PERO con bloque de stats (tarjeta completa)
-      - (Ignoramos jam-level y 'as usual/longer than usual')
-    """
-    script = r"""
-// ======== Helpers que atraviesan Shadow DOM ========
-function qDeep(el, sel){
-  if (!el) return null;
-  let n = null;
-  try { n = el.querySelector ? el.querySelector(sel) : null; } catch(e){}
-  if (n) return n;
-  if (el.shadowRoot){
-    try { n = el.shadowRoot.querySelector(sel); } catch(e){}
-  }
-  return n || null;
-}
-function qTextDeep(el, sel){
-  const n = qDeep(el, sel);
-  if (!n) return '';
-  const t = (n.innerText || n.textContent || '').trim();
-  return t;
-}
-function getJamDeep(el){
-  const cand = [el];
-  if (el && el.shadowRoot) cand.push(el.shadowRoot);
-  for (const c of cand){
-    try{
-      const n = c.querySelector ? c.querySelector('.jam-level') : null;
-      if (n){
-        const m = (n.className || '').match(/jam-level-(\d)/);
-        if (m) return parseInt(m[1],10);
-      }
-    }catch(e){}
-  }
-  return null;
-}
-// Sube por parentElement y, si entra a un ShadowRoot, cruza con host
-function climbToSection(el){
-  let n = el;
-  let guard = 0;
-  while (n && guard++ < 80){
-    if (n.closest){
-      const sec = n.closest('app-traffic-view-sidebar-section');
-      if (sec) return sec;
-    }
-    const root = n.getRootNode ? n.getRootNode() : null;
-    if (root && root.host){
-      n = root.host;
-      continue;
-    }
-    n = n.parentElement;
-  }
-  return null;
-}
-function sectionFlagFor(el){
-  const sec = climbToSection(el);
-  if (!sec) return '';
-  let cap = qDeep(sec, ':scope > wz-caption') || qDeep(sec, 'wz-caption');
-  let t = (cap && (cap.innerText || cap.textContent) || '').trim().toLowerCase();
-  if (/unusual|inusual/.test(t)) return 'unusual';
-  if (/watchlist|lista de seguimiento/.test(t)) return 'watch';
-  cap = qDeep(sec, '.section-header') || qDeep(sec, '[class*=header]');
-  if (cap){
-    t = (cap.innerText || cap.textContent || '').trim().toLowerCase();
-    if (/unusual|inusual/.test(t)) return 'unusual';
-    if (/watchlist|lista de seguimiento/.test(t)) return 'watch';
-  }
-  return '';
-}
-
-// ======== Helpers específicos para esta regla ========
-// 1) ¿Tiene menú de acciones (Edit/Delete)? -> WATCHLIST
-function hasRouteMenu(el){
-  // buscamos cualquier rastro de <div class="route-menu"> y wz-menu/wz-menu-item dentro del mismo route
-  const variants = [
-    '.route-menu wz-menu-item',
-    '.route-menu wz-menu',
-    '.route-menu',
-    'wz-menu-item',
-    'wz-menu'
-  ];
-  for (const sel of variants){
-    const n = qDeep(el, sel);
-    if (n) return true;
-  }
-  return false;
-}
-
-// 2) ¿Tiene bloque de stats “normal”? -> nos sirve para certificar INUSUAL
-function hasStats(el){
-  // basta con que exista el contenedor de stats, y al menos uno de current/historic
-  const statsHost = qDeep(el, 'app-traffic-view-route-stats');
-  if (!statsHost) return false;
-  const hasCurr = !!qDeep(el, '.current-stat');
-  const hasHist = !!qDeep(el, '.historic-stat');
-  return hasCurr || hasHist;
-}
+    # Sacudida final: esperamos dos rAF en el navegador en vez de dormir
+    # tiempos fijos (los sleeps de 70/150 ms agotaban el timeout del
+    # execute_async_script en páginas lentas sin aportar nada en las rápidas).
+    try:
+        evaluar(_JS_SACUDIDA, await_promise=True)
+    except Exception:
+        evaluar(f"{_JS_EL}.scrollTop = {_JS_EL}.scrollHeight")
+        time.sleep(0.15)
 
+# Biblioteca JS de extracción: un solo paseo plano por tarjeta. Se comparte
+# entre la extracción suelta y el "scroll+extract" de un solo round-trip.
+_JS_EXTRACT_LIB = r"""
 // ======== Extracción principal ========
+function __extraerTramos(){
 let routes = Array.from(document.querySelectorAll('app-traffic-view-route'));
 if (routes.length === 0){
   const secs = Array.from(document.querySelectorAll('app-traffic-view-sidebar-section'));
@@ -303,49 +405,158 @@ if (routes.length === 0){
   }
 }
 
-const out = [];
+function txt(n){ return n ? (n.innerText || n.textContent || '').trim() : ''; }
+
+// Formato empacado: una sola cadena con campos \x1f y filas \x1e, más un
+// arreglo de enteros con la bandera por fila. Un string JSON grande viaja
+// (y se parsea) mucho más barato que N arreglos anidados.
+const strs = [];
+const ints = [];
+const seen = new Set();
 for (const r of routes){
-  const name = qTextDeep(r, 'wz-subhead4');
+  // Un querySelector directo por campo sobre el light DOM; solo si la
+  // tarjeta no expone el nombre ahí cruzamos al shadow root.
+  let host = r;
+  let sub = r.querySelector('wz-subhead4');
+  if (!sub && r.shadowRoot){
+    host = r.shadowRoot;
+    try { sub = host.querySelector('wz-subhead4'); } catch(e){}
+  }
+  const name = txt(sub);
   if (!name) continue;
 
-  const current = qTextDeep(r, '.current-stat');
-  const historic = qTextDeep(r, '.historic-stat');
-  const dist = qTextDeep(r, '.route-distance');
-  const jam = getJamDeep(r);
+  const curEl = host.querySelector('.current-stat');
+  const hisEl = host.querySelector('.historic-stat');
+  const current = txt(curEl);
+  const historic = txt(hisEl);
+  const dist = txt(host.querySelector('.route-distance'));
+  const jamEl = host.querySelector('.jam-level');
+  const jam = jamEl ? (jamEl.className || '') : null;
 
   // --- Señales de clasificación
-  const flag_from_section = sectionFlagFor(r); // puede venir vacío
-  const menuPresent = hasRouteMenu(r);
-  const statsPresent = hasStats(r);
+  const menuPresent = !!host.querySelector('.route-menu, wz-menu, wz-menu-item');
+  const statsPresent = !!(host.querySelector('app-traffic-view-route-stats') && (curEl || hisEl));
 
-  // *** PRIORIDAD DE BANDERA ***
+  // *** PRIORIDAD DE BANDERA *** (0 = desconocido, 1 = inusual, 2 = watch)
   // 1) Si hay menú -> WATCHLIST (no tocar lo que ya funciona)
   // 2) Si NO hay menú pero hay stats -> INUSUAL
   // (Ignoramos jam level y textos as/longer than usual)
-  let flag = '';
+  let flag = 0;
   if (menuPresent){
-    flag = 'watch';
+    flag = 2;
   } else if (statsPresent){
-    flag = 'unusual';
-  } else {
-    // si quisieras, podrías dejar caer a lo que diga la sección
-    // pero por la regla pedida, nos quedamos así en '' (desconocido)
-    if (flag_from_section === 'unusual' || flag_from_section === 'watch'){
-      // opcionalmente podrías usarlo de respaldo:
-      // flag = flag_from_section;
-    }
+    flag = 1;
   }
 
-  out.push({ name, current, historic, dist, jam, section_flag: flag });
+  const key = name + '|' + dist + '|' + (current || historic || '');
+  if (seen.has(key)) continue;
+  seen.add(key);
+  strs.push(name + '\x1f' + current + '\x1f' + historic + '\x1f' + dist + '\x1f' + (jam || ''));
+  ints.push(flag);
 }
-return out;
+return [strs.join('\x1e'), ints];
+}
+"""
+
+# Registra el extractor una sola vez como window.__extraerTramos: así cada
+# captura evalúa una llamada de ~30 bytes en vez de re-enviar (y re-parsear
+# en V8) el script completo.
+_JS_REGISTRAR_EXTRACTOR = (
+    "(function(){" + _JS_EXTRACT_LIB + " window.__extraerTramos = __extraerTramos; })()"
+)
+
+# Scroll completo + extracción en UNA sola llamada asíncrona: el bucle corre
+# dentro del navegador (N scrolls, estabilidad por conteo, sacudida final) y
+# devuelve el arreglo ya extraído. Cientos de round-trips → 1.
+_JS_SCROLL_Y_EXTRAER = (
+    "(async function(){"
+    + _JS_PREPARAR_SCROLL + ";"
+    + r"""
+  const el = window.__wazeScrollEl || document.scrollingElement;
+  // Paro por convergencia (mismo criterio que el bucle Python de respaldo):
+  // sin crecimiento en la ventana de 4 conteos + fondo alcanzado, 2 veces.
+  const buf = [];
+  let stable = 0, iters = 0;
+  while (true){
+    el.scrollBy(0, 600);
+    await window.__wazeWait(400);
+    const count = document.querySelectorAll('app-traffic-view-route').length;
+    buf.push(count);
+    if (buf.length > 4) buf.shift();
+    const fondo = el.scrollTop + el.clientHeight >= el.scrollHeight - 2;
+    if (buf.length >= 2 && count - Math.min.apply(null, buf) === 0 && fondo){
+      stable += 1;
+      if (stable >= 2) break;
+    } else {
+      stable = 0;
+    }
+    iters += 1;
+    if (iters >= Math.max(60, count * 3)) break;
+  }
+  // Sacudida final (settle por doble rAF, sin timeouts fijos)
+  const settle = () => new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r)));
+  el.scrollTop = Math.max(0, el.scrollTop - 200);
+  await settle();
+  el.scrollTop = el.scrollHeight;
+  await settle();
 """
+    + " return window.__extraerTramos ? window.__extraerTramos() : null; })()"
+)
+
+
+_FLAG_CODES = ("", "unusual", "watch")
+
+
+def _desempaquetar(brut):
+    """
+    Decodifica el formato empacado [cadena \\x1e/\\x1f, [flags]] a filas
+    (name, current, historic, dist, jam, flag). Las listas de filas del
+    extractor de respaldo pasan tal cual.
+    """
+    try:
+        empacado, ints = brut
+    except Exception:
+        return brut
+    if not isinstance(empacado, str):
+        return brut
+    filas = []
+    if empacado:
+        for i, fila in enumerate(empacado.split("\x1e")):
+            campos = fila.split("\x1f")
+            if len(campos) != 5:
+                continue
+            name, curr, hist, dist, jamcls = campos
+            try:
+                code = int(ints[i])
+            except Exception:
+                code = 0
+            flag = _FLAG_CODES[code] if 0 <= code < len(_FLAG_CODES) else ""
+            filas.append((name, curr, hist, dist, jamcls or None, flag))
+    return filas
+
+
+def _js_extraer_tramos(driver, evaluar=None):
+    """
+    Extracción principal. Además de textos, determina la sección del panel
+    (Unusual/Watchlist) y la embebe como `section_flag` ('unusual' | 'watch' | '').
+    Regla pedida:
+      - WATCHLIST  = tarjeta con menú de acciones (route-menu con Edit/Delete)
+      - INUSUAL    = SIN menú de acciones PERO con bloque de stats (tarjeta completa)
+      - (Ignoramos jam-level y 'as usual/longer than usual')
+    """
+    if evaluar is None:
+        evaluar = _default_evaluar(driver)
     try:
-        return driver.execute_script(script)
+        brut = evaluar("window.__extraerTramos ? window.__extraerTramos() : null")
+        if brut is None:
+            # El extractor aún no está registrado en este documento
+            evaluar(_JS_REGISTRAR_EXTRACTOR)
+            brut = evaluar("window.__extraerTramos ? window.__extraerTramos() : null")
+        return _desempaquetar(brut) if brut else []
     except Exception:
         return []
 
-def _js_extraer_tramos_fallback(driver):
+def _js_extraer_tramos_fallback(driver, evaluar=None):
     """
     Fallback ultra-simple si el DOM cambia: calcula `section_flag` subiendo en
     la jerarquía (cruzando shadow roots) y toma textos mínimos.
@@ -373,6 +584,7 @@ function sectionFlagFor(el){
 }
 const routes = Array.from(document.querySelectorAll('app-traffic-view-route'));
 const out = [];
+const seen = new Set();
 for (const r of routes){
   const name = qText(r.querySelector('wz-subhead4')) || (r.shadowRoot ? qText(r.shadowRoot.querySelector('wz-subhead4')) : '');
   if (!name) continue;
@@ -380,60 +592,57 @@ for (const r of routes){
   const hist = qText(r.querySelector('.historic-stat')) || (r.shadowRoot ? qText(r.shadowRoot.querySelector('.historic-stat')) : '');
   const dist = qText(r.querySelector('.route-distance')) || (r.shadowRoot ? qText(r.shadowRoot.querySelector('.route-distance')) : '');
   const jamEl = r.querySelector('.jam-level') || (r.shadowRoot ? r.shadowRoot.querySelector('.jam-level') : null);
-  const m = jamEl && (jamEl.className || '').match(/jam-level-(\d)/);
-  const jam = m ? parseInt(m[1],10) : null;
+  const jam = jamEl ? (jamEl.className || '') : null;
   const flag = sectionFlagFor(r);
-  out.push({ name, current: curr, historic: hist, dist, jam, section_flag: flag });
+  const key = name + '|' + dist + '|' + (curr || hist || '');
+  if (seen.has(key)) continue;
+  seen.add(key);
+  out.push([name, curr, hist, dist, jam, flag]);
 }
 return out;
 """
+    if evaluar is None:
+        evaluar = _default_evaluar(driver)
     try:
-        return driver.execute_script(script)
+        return evaluar("(function(){" + script + "})()") or []
     except Exception:
         return []
 
 
 # ===================== Parsers robustos =====================
-def _parse_minutos(texto: str) -> Optional[int]:
-    if not texto:
-        return None
-    m = re.search(r"(\d+)\s*min(?:utos)?\b", texto, flags=re.I)
-    if not m:
-        return None
-    try:
-        return int(m.group(1))
-    except Exception:
-        return None
-
-
-def _parse_vel_kmh(texto: str) -> Optional[float]:
-    if not texto:
-        return None
-    m = re.search(r"([\d.,]+)\s*km/?h", texto, flags=re.I)
-    if not m:
-        return None
-    try:
-        return float(m.group(1).replace(",", "."))
-    except Exception:
-        return None
-
-
-def _parse_stat_to_min_vel(texto: str) -> Tuple[Optional[int], Optional[float]]:
+def _parse_todos(texto: str) -> Tuple[Optional[int], Optional[float], Optional[float]]:
+    """
+    Una sola pasada de `_RE_ALL` sobre "current | historic | dist" que
+    devuelve (minutos, vel_kmh, dist_km). Se queda con la primera aparición
+    de cada campo, igual que los parsers separados de antes.
+    """
+    minutos = vel = dist = None
     if not texto:
-        return None, None
-    return _parse_minutos(texto), _parse_vel_kmh(texto)
+        return None, None, None
+    for m in _RE_ALL.finditer(texto):
+        g = m.lastgroup
+        try:
+            if g == "min" and minutos is None:
+                minutos = int(m.group("min"))
+            elif g == "kmh" and vel is None:
+                vel = float(m.group("kmh").replace(",", "."))
+            elif g == "km" and dist is None:
+                dist = float(m.group("km").replace(",", "."))
+        except Exception:
+            continue
+        if minutos is not None and vel is not None and dist is not None:
+            break
+    return minutos, vel, dist
 
 
-def _parse_dist_km(texto: str) -> Optional[float]:
-    if not texto:
-        return None
-    m = re.search(r"([\d.,]+)\s*km\b", texto, flags=re.I)
-    if not m:
-        return None
-    try:
-        return float(m.group(1).replace(",", "."))
-    except Exception:
+def _parse_jam(valor) -> Optional[int]:
+    """El JS devuelve la cadena de clases del .jam-level; el dígito se saca aquí."""
+    if isinstance(valor, int):
+        return valor
+    if not valor:
         return None
+    m = _RE_JAM.search(valor)
+    return int(m.group(1)) if m else None
 
 
 def _tiempo_desde_dist_y_vel(dist_km: Optional[float], vel_kmh: Optional[float]) -> Tuple[Optional[int], str]:
@@ -460,15 +669,30 @@ class TrafficDetector:
         self.cfg = cfg
         self.logger = logger
         self.driver = None
+        self._cdp_hub = None      # hub CDP compartido por navegador
+        self._cdp_session = None  # sessionId de la pestaña de este detector
+        self._panel_ready = False  # panel ya esperado (evita el WebDriverWait doble)
 
     def start(self):
         self.driver = _build_driver(self.cfg)
         self.driver.get(self.cfg.waze_url)
         try:
             _activar_traffic_view(self.driver, self.log)
+            self._panel_ready = True
         except Exception as e:
             self.close()
             raise e
+        self._cdp_connect()
+        # Registrar el extractor para este documento y los que vengan
+        # (refresh/navegación) — así detect_all solo llama por nombre.
+        try:
+            self.driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument",
+                {"source": _JS_REGISTRAR_EXTRACTOR},
+            )
+        except Exception:
+            pass
+        self._ensure_extractor()
         # registrar este detector para poder cerrarlo desde la GUI
         try:
             _GLOBAL_DETECTORS.add(self)
@@ -477,10 +701,78 @@ class TrafficDetector:
         global _LAST_DRIVER
         _LAST_DRIVER = self.driver
 
+    # ---------- CDP ----------
+    def _cdp_connect(self):
+        """
+        Se adjunta al hub CDP del navegador (un WS compartido por Chrome) y
+        guarda el sessionId de la pestaña. Cada evaluación es 1 frame WS en
+        vez de 1 POST HTTP vía chromedriver. Si algo falla, el detector
+        sigue funcionando con execute_script.
+        """
+        self._cdp_hub = None
+        self._cdp_session = None
+        if not self.driver:
+            return
+        try:
+            addr = self.driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+            hub = _CDPHub.for_address(addr)
+            try:
+                self._cdp_session = hub.attach_first_page()
+                self._cdp_hub = hub
+            except Exception:
+                hub.release()
+        except Exception:
+            self._cdp_hub = None
+            self._cdp_session = None
+
+    def _cdp_close(self):
+        if self._cdp_hub is not None:
+            try:
+                self._cdp_hub.release()
+            except Exception:
+                pass
+            self._cdp_hub = None
+            self._cdp_session = None
+
+    def _send(self, method: str, params: dict = None) -> dict:
+        """Comando CDP crudo sobre la sesión de este detector."""
+        if self._cdp_hub is None:
+            raise RuntimeError("CDP no conectado")
+        return self._cdp_hub.send(method, params, session_id=self._cdp_session)
+
+    def _cdp_eval(self, expr: str, await_promise: bool = False):
+        """
+        Evalúa una expresión JS vía Runtime.evaluate sobre el WS compartido.
+        Si el hub no está disponible cae a execute_cdp_cmd y, en último
+        término, a execute_script (mismo resultado).
+        """
+        if self._cdp_hub is not None:
+            try:
+                res = self._send("Runtime.evaluate", {
+                    "expression": expr,
+                    "returnByValue": True,
+                    "awaitPromise": bool(await_promise),
+                })
+                return res.get("result", {}).get("value")
+            except Exception:
+                # WS roto (navegación, cierre…): se reintenta en la próxima captura
+                self._cdp_close()
+        return _default_evaluar(self.driver)(expr, await_promise)
+
+    def _ensure_extractor(self):
+        """Define window.__extraerTramos si el documento actual no lo tiene."""
+        try:
+            if not self._cdp_eval("!!window.__extraerTramos"):
+                self._cdp_eval(_JS_REGISTRAR_EXTRACTOR)
+        except Exception:
+            pass
+
     def refresh(self):
         if self.driver:
+            self._panel_ready = False
             self.driver.refresh()
             _esperar_panel(self.driver, timeout=30)
+            self._panel_ready = True
 
     def detect_all(self) -> list:
         if not self.driver:
@@ -488,46 +780,67 @@ class TrafficDetector:
 
         _, _, _, _, _, TimeoutException, _ = _get_selenium_bits()
 
-        try:
-            _esperar_panel(self.driver, timeout=30)
-        except TimeoutException:
-            self.log("Panel lateral no apareció a tiempo")
-            return []
+        # start()/refresh() ya esperaron el panel; no repetir el WebDriverWait
+        if not self._panel_ready:
+            try:
+                _esperar_panel(self.driver, timeout=30)
+                self._panel_ready = True
+            except TimeoutException:
+                self.log("Panel lateral no apareció a tiempo")
+                return []
 
         self.log("Iniciando scroll y extracción JS…")
-        _cargar_lista_completa(self.driver, self.log)
 
+        # Camino rápido: scroll + extracción completos en un solo round-trip.
+        self._ensure_extractor()
         try:
-            total_dom = self.driver.execute_script(
-                "return document.querySelectorAll('app-traffic-view-route').length;"
-            )
-            self.log(f"[JS] Rutas en DOM tras scroll: {total_dom}")
+            brut = self._cdp_eval(_JS_SCROLL_Y_EXTRAER, await_promise=True) or []
+            brut = _desempaquetar(brut)
         except Exception:
-            pass
+            brut = []
+
+        if brut:
+            self.log(f"[JS] Scroll+extracción en 1 llamada: {len(brut)} rutas")
+        else:
+            # Fallback: bucle de scroll desde Python + extracción separada
+            self.log("[JS] Camino único devolvió 0; usando bucle de scroll en Python…")
+            _cargar_lista_completa(self.driver, self.log, evaluar=self._cdp_eval)
+
+            try:
+                total_dom = self._cdp_eval(_JS_CONTAR)
+                self.log(f"[JS] Rutas en DOM tras scroll: {total_dom}")
+            except Exception:
+                pass
 
-        brut = _js_extraer_tramos(self.driver)
-        if not brut:
-            self.log("[JS] _js_extraer_tramos devolvió 0; intentando fallback…")
-            brut = _js_extraer_tramos_fallback(self.driver)
+            brut = _js_extraer_tramos(self.driver, evaluar=self._cdp_eval)
             if not brut:
-                self.log("[JS] Fallback también devolvió 0 — verifica que el panel esté expandido (Traffic View activo).")
-                return []
+                self.log("[JS] _js_extraer_tramos devolvió 0; intentando fallback…")
+                brut = _js_extraer_tramos_fallback(self.driver, evaluar=self._cdp_eval)
+                if not brut:
+                    self.log("[JS] Fallback también devolvió 0 — verifica que el panel esté expandido (Traffic View activo).")
+                    return []
 
         vistos = set()
         lista = []
 
-        # Import diferido para el dataclass y evitar ciclos
-        from models import TramoNorm
+        global TramoNorm
+        if TramoNorm is None:  # respaldo por si el import de módulo cicló
+            from models import TramoNorm
 
-        for r in brut:
-            name = (r.get("name") or "").strip()
-            dist_raw = (r.get("dist") or "").strip()
-            curr = (r.get("current") or "").strip()
-            hist = (r.get("historic") or "").strip()
-            jam = r.get("jam")
+        for fila in brut:
+            # Filas compactas [name, current, historic, dist, jam, flag]
+            try:
+                name, curr, hist, dist_raw, jam_raw, flag = fila
+            except Exception:
+                continue
+            name = (name or "").strip()
+            dist_raw = (dist_raw or "").strip()
+            curr = (curr or "").strip()
+            hist = (hist or "").strip()
+            jam = _parse_jam(jam_raw)
 
             # CLAVE: usar SOLO la sección del panel para clasificar
-            flag = (r.get("section_flag") or "").strip().lower()
+            flag = (flag or "").strip().lower()
             if flag == "unusual":
                 es_usual = False
             elif flag == "watch":
@@ -539,19 +852,16 @@ class TrafficDetector:
             if not name:
                 continue
 
-            # Dedupe por (nombre, distancia, current/historic visible)
-            clave_curr = curr if curr else (hist or "")
-            clave = f"{name}||{dist_raw}||{clave_curr}"
+            # Dedupe por (nombre, distancia, current/historic visible).
+            # Clave tupla: hashea directo, sin armar un string intermedio.
+            clave = (name, dist_raw, curr if curr else (hist or ""))
             if clave in vistos:
                 continue
             vistos.add(clave)
 
-            # Parse de tiempos/velocidades/distancias
-            min_c, vel_c = _parse_stat_to_min_vel(curr)
-            min_h, vel_h = _parse_stat_to_min_vel(hist)
-            minutos = min_c if min_c is not None else min_h
-            vel = vel_c if vel_c is not None else vel_h
-            d_km = _parse_dist_km(dist_raw)
+            # Parse de tiempos/velocidades/distancias en una sola pasada
+            # (current primero: su match gana, como antes)
+            minutos, vel, d_km = _parse_todos(f"{curr} | {hist} | {dist_raw}")
 
             if isinstance(minutos, int):
                 tiempo_seg = int(minutos * 60)
@@ -572,6 +882,7 @@ class TrafficDetector:
 
     def close(self):
         global _LAST_DRIVER
+        self._cdp_close()
         if self.driver:
             try:
                 self.driver.quit()
@@ -640,24 +951,7 @@ def detect_all_segments():
     devolviendo una lista de diccionarios.
     """
     det = _get_detector()
-    tramos = det.detect_all()
-    out = []
-    for t in tramos:
-        out.append({
-            "nombre": t.nombre,
-            "dist_km": t.dist_km,
-            "tiempo_min": t.tiempo_min,
-            "tiempo_seg": t.tiempo_seg,
-            "tiempo_mmss": t.tiempo_mmss,
-            "vel_kmh": t.vel_kmh,
-            "jam": t.jam,
-            "es_usual": t.es_usual,
-            "current_raw": t.current_raw,
-            "historic_raw": t.historic_raw,
-            "dist_raw": t.dist_raw,
-            "raw": t.raw
-        })
-    return out
+    return [t.as_dict() for t in det.detect_all()]
 
 
 def capture_and_save():
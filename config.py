@@ -3,11 +3,15 @@
 
 from __future__ import annotations
 
+import atexit
+import functools
 import json
 import logging
 import logging.handlers
 import os
+import queue
 import tempfile
+import threading
 from pathlib import Path
 from typing import Dict, Tuple, Any
 from datetime import datetime, timedelta
@@ -15,6 +19,21 @@ from datetime import datetime, timedelta
 # === Persistencia de config (JSON en el home del usuario) ===
 CFG_PATH = Path.home() / ".captura_waze_config.json"
 
+# Codificador JSON: orjson (C, E/S binaria) si está instalado; si no, la
+# stdlib con la misma interfaz de bytes. Ambos producen JSON indentado.
+try:
+    import orjson as _orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return _orjson.dumps(obj, option=_orjson.OPT_INDENT_2)
+
+    _json_loads = _orjson.loads
+except Exception:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+    _json_loads = json.loads
+
 # === Perfil de Chrome (para Selenium) ===
 PROFILE_DIR = Path.home() / ".captura_waze_chrome_profile"
 PROFILE_DIR.mkdir(parents=True, exist_ok=True)
@@ -36,21 +55,44 @@ DEFAULTS: Dict[str, Any] = {
     "log_level": "INFO",
 }
 
+# Cache de load_cfg: (mtime_ns, dict). Solo re-parseamos el JSON si el
+# archivo cambió en disco; las lecturas repetidas devuelven una copia.
+_cfg_cache: tuple[int, Dict[str, Any]] | None = None
+
 def load_cfg() -> Dict[str, Any]:
+    global _cfg_cache
     try:
-        data = json.loads(CFG_PATH.read_text(encoding="utf-8"))
-        # Completar faltantes con defaults
-        for k, v in DEFAULTS.items():
-            data.setdefault(k, v)
-        return data
+        mtime = CFG_PATH.stat().st_mtime_ns
+        if _cfg_cache is not None and _cfg_cache[0] == mtime:
+            return dict(_cfg_cache[1])
+        data = _json_loads(CFG_PATH.read_bytes())
+        # Completar faltantes con defaults (merge en C, sin bucle de setdefault)
+        data = {**DEFAULTS, **data}
+        _cfg_cache = (mtime, data)
+        return dict(data)
     except Exception:
         return dict(DEFAULTS)
 
+# Últimos bytes escritos: si la config no cambió, ni tocamos el disco.
+_last_cfg_bytes: bytes | None = None
+
 def save_cfg(cfg: Dict[str, Any]) -> None:
+    global _last_cfg_bytes
     # Guardamos solo claves conocidas para evitar crecer el archivo con basura
-    safe = {k: cfg.get(k, DEFAULTS[k]) for k in DEFAULTS.keys()}
+    safe = {k: cfg.get(k, d) for k, d in DEFAULTS.items()}
     try:
-        CFG_PATH.write_text(json.dumps(safe, indent=2, ensure_ascii=False), encoding="utf-8")
+        payload = _json_dumps(safe)
+        if payload == _last_cfg_bytes:
+            return
+        # Escritura atómica: tmp + fsync + os.replace, para que un corte de
+        # luz nunca deje el JSON a medias.
+        tmp = CFG_PATH.with_suffix(".json.tmp")
+        with open(tmp, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, CFG_PATH)
+        _last_cfg_bytes = payload
     except Exception:
         pass
 
@@ -58,14 +100,20 @@ def save_cfg(cfg: Dict[str, Any]) -> None:
 def _dir_escribible(d: Path) -> bool:
     try:
         d.mkdir(parents=True, exist_ok=True)
-        p = d / (".writetest_" + str(os.getpid()))
-        with open(p, "w", encoding="utf-8") as f:
-            f.write("ok")
+        if not os.access(str(d), os.W_OK):
+            return False
+        if os.name != "nt":
+            return True
+        # En Windows os.access puede mentir (ACLs); confirmamos con un touch
+        # real solo en ese caso.
+        p = str(d / (".writetest_" + str(os.getpid())))
         try:
-            p.unlink()
+            fd = os.open(p, os.O_CREAT | os.O_WRONLY | os.O_EXCL)
+            os.close(fd)
+            os.unlink(p)
+            return True
         except Exception:
-            pass
-        return True
+            return False
     except Exception:
         return False
 
@@ -82,35 +130,103 @@ def _ruta_log_usuario(filename: str = "captura_waze.log") -> Path:
             return d / filename
     return Path(tempfile.gettempdir()) / filename
 
-LOG_PATH = _ruta_log_usuario("captura_waze.log")
-
 logger = logging.getLogger("captura_waze")
 logger.setLevel(logging.INFO)
 
-try:
-    _handler = logging.handlers.RotatingFileHandler(
-        LOG_PATH, maxBytes=2_000_000, backupCount=5, encoding="utf-8"
-    )
-except Exception:
-    _handler = logging.StreamHandler()
+# No usamos hilo/proceso en el formato: apagar su captura ahorra trabajo
+# por registro. El datefmt explícito evita el camino con milisegundos.
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+_FMT = logging.Formatter(
+    "%(asctime)s | %(levelname)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# La ruta del log (con su sondeo de directorios escribibles) y el handler de
+# archivo se resuelven perezosamente: importar config ya no toca el disco.
+@functools.lru_cache(maxsize=1)
+def _get_log_path() -> Path:
+    return _ruta_log_usuario("captura_waze.log")
+
+@functools.lru_cache(maxsize=1)
+def _get_handler() -> logging.Handler:
+    try:
+        h = logging.handlers.RotatingFileHandler(
+            _get_log_path(), maxBytes=2_000_000, backupCount=5, encoding="utf-8"
+        )
+    except Exception:
+        h = logging.StreamHandler()
+    h.setFormatter(_FMT)
+    h.setLevel(logger.level)
+    return h
 
-_handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s"))
+def __getattr__(name: str):
+    # LOG_PATH sigue disponible como atributo del módulo, pero se calcula
+    # en el primer acceso (PEP 562) en vez de al importar.
+    if name == "LOG_PATH":
+        return _get_log_path()
+    raise AttributeError(name)
 
-if not any(isinstance(h, (logging.handlers.RotatingFileHandler, logging.StreamHandler)) for h in logger.handlers):
-    logger.addHandler(_handler)
+# Pipeline diferido: el hilo que llama a logger.* solo encola el registro
+# (queue.put, sin tocar disco); un QueueListener en segundo plano es quien
+# escribe al RotatingFileHandler. Así el bucle de captura no se bloquea en I/O.
+_log_queue: queue.Queue = queue.Queue(-1)
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+
+# Entre el listener y el archivo va un MemoryHandler: INFO/DEBUG se acumulan
+# y se escriben en lotes de hasta 256; ERROR o peor fuerza el flush inmediato,
+# así que los errores nunca se quedan retenidos en memoria.
+class _LazyMemoryHandler(logging.handlers.MemoryHandler):
+    # El handler de archivo se construye en el primer flush con registros
+    # pendientes; si el proceso nunca loggea, nunca se sondea el disco.
+    def flush(self) -> None:
+        if self.target is None and self.buffer:
+            self.setTarget(_get_handler())
+        super().flush()
+
+_mem = _LazyMemoryHandler(256, flushLevel=logging.ERROR, flushOnClose=True)
+_listener = logging.handlers.QueueListener(_log_queue, _mem, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)  # vacía lo pendiente al salir
+
+def _flush_log_periodico() -> None:
+    # Acota la latencia de los lotes: aunque no llegue un ERROR, lo acumulado
+    # toca disco al menos cada 30 s.
+    try:
+        _mem.flush()
+    except Exception:
+        pass
+    t = threading.Timer(30.0, _flush_log_periodico)
+    t.daemon = True
+    t.start()
+
+_flush_log_periodico()
+
+if not any(isinstance(h, logging.handlers.QueueHandler) for h in logger.handlers):
+    logger.addHandler(_queue_handler)
+
+_LVL_MAP = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
 
 def set_log_level(level_str: str) -> None:
-    level = {
-        "DEBUG": logging.DEBUG,
-        "INFO": logging.INFO,
-        "WARNING": logging.WARNING,
-        "ERROR": logging.ERROR,
-        "CRITICAL": logging.CRITICAL,
-    }.get((level_str or "").upper(), logging.INFO)
+    level = _LVL_MAP.get((level_str or "").upper(), logging.INFO)
+    if level == logger.level:
+        return
     logger.setLevel(level)
     for h in logger.handlers:
         h.setLevel(level)
-    logger.info(f"Nivel de log establecido a: {logging.getLevelName(level)}")
+    # Los handlers reales viven detrás del listener, no en logger.handlers
+    _mem.setLevel(level)
+    if _mem.target is not None:
+        _mem.target.setLevel(level)
+    # Formato %-style: el string solo se construye si el registro se emite
+    logger.info("Nivel de log establecido a: %s", logging.getLevelName(level))
 
 # === Variables “runtime” exportadas (para compatibilidad con la GUI) ===
 #     Nota: la GUI normalmente actualizará estos valores después de la pantalla de inicio.
@@ -130,17 +246,26 @@ perfil_persistente_default: bool = bool(_cfg_boot.get("perfil_persistente", DEFA
 log_level_default: str = str(_cfg_boot.get("log_level", DEFAULTS["log_level"]))
 excel_path_default: str = str(_cfg_boot.get("excel_path", DEFAULTS["excel_path"]))
 
+def _as_tuple(v, fallback: Tuple[int, int]) -> Tuple[int, int]:
+    # Evita re-alocar cuando el valor ya es la tupla cacheada (camino común
+    # cuando la GUI reaplica la config sin cambios)
+    if v is None:
+        return fallback
+    return v if type(v) is tuple else tuple(v)
+
 # Helpers para que la GUI aplique su resultado y sincronice estas globals
 def apply_ui_result(result: Dict[str, Any]) -> None:
     """
     Sincroniza las variables globales con lo elegido en la ventana de configuración.
     `result` debe contener: modo_247, hora_ini, hora_fin, periodicidad_min, headless, perfil_persistente, log_level, excel_path
     """
-    global modo_247, hora_ini, hora_fin, intervalo_captura
+    global modo_247, hora_ini, hora_fin, intervalo_captura, intervalo_captura_min, _next_start_key
     modo_247 = bool(result.get("modo_247", modo_247))
-    hora_ini = tuple(result.get("hora_ini", hora_ini))  # (h, m)
-    hora_fin = tuple(result.get("hora_fin", hora_fin))  # (h, m)
-    intervalo_captura = max(10, int(result.get("periodicidad_min", intervalo_captura // 60))) * 60
+    hora_ini = _as_tuple(result.get("hora_ini"), hora_ini)  # (h, m)
+    hora_fin = _as_tuple(result.get("hora_fin"), hora_fin)  # (h, m)
+    _next_start_key = None  # tabla de próximos inicios: recalcular
+    intervalo_captura_min = max(10, int(result.get("periodicidad_min", intervalo_captura // 60)))
+    intervalo_captura = intervalo_captura_min * 60
     # Ajustar log level si lo pidieron
     if "log_level" in result:
         set_log_level(str(result["log_level"]))
@@ -151,8 +276,9 @@ def set_runtime_period_minutes(mins: int) -> None:
     Ajusta el intervalo de captura en minutos (mínimo 10) y lo guarda en la
     variable global `intervalo_captura` (en segundos).
     """
-    global intervalo_captura
-    intervalo_captura = max(10, int(mins)) * 60
+    global intervalo_captura, intervalo_captura_min
+    intervalo_captura_min = max(10, int(mins))
+    intervalo_captura = intervalo_captura_min * 60
 
 def get_runtime_period_seconds() -> int:
     """
@@ -160,38 +286,81 @@ def get_runtime_period_seconds() -> int:
     """
     return int(intervalo_captura)
 
+def get_runtime_period_minutes() -> int:
+    """
+    Devuelve el intervalo de captura actual en minutos (ya memoizado,
+    sin dividir en cada refresco de la GUI).
+    """
+    return int(intervalo_captura_min)
+
 # Mantener compatibilidad con la GUI (usa este nombre como "sugerido")
 intervalo_captura_sugerido: int = intervalo_captura
+intervalo_captura_min: int = intervalo_captura // 60
 
 # === Utilidades de horario (la GUI las importa desde aquí) ===
 def _dt_con_hora(base_dt: datetime, hh: int, mm: int) -> datetime:
     return base_dt.replace(hour=hh, minute=mm, second=0, microsecond=0)
 
-def esta_dentro_horario(dt: datetime) -> bool:
-    global modo_247, hora_ini, hora_fin
-    if modo_247:
+# Rueda de 24 h: para un (hora_ini, hora_fin) fijo, los segundos hasta el
+# próximo inicio son función pura del minuto-del-día. La tabla de 1440
+# entradas se reconstruye solo cuando cambian las horas configuradas.
+_next_start_table: list[int] | None = None
+_next_start_key: tuple | None = None
+
+def _rebuild_next_start_table() -> list[int]:
+    global _next_start_table, _next_start_key
+    mi = hora_ini[0] * 60 + hora_ini[1]
+    mf = hora_fin[0] * 60 + hora_fin[1]
+    tabla = [0] * 1440
+    for m in range(1440):
+        dentro = (mi <= m < mf) if mi <= mf else not (mf <= m < mi)
+        if not dentro:
+            # `or 1440`: con hora_ini == hora_fin la ventana es vacía y el
+            # próximo inicio es siempre el del día siguiente
+            tabla[m] = ((mi - m) % 1440 or 1440) * 60
+    _next_start_table = tabla
+    _next_start_key = (hora_ini, hora_fin)
+    return tabla
+
+def esta_dentro_horario(dt: datetime, _g=globals()) -> bool:
+    # _g liga el dict de globals como argumento por defecto: los accesos al
+    # estado del horario son LOAD_FAST + subíndice en vez de LOAD_GLOBAL.
+    if _g["modo_247"]:
         return True
-    hi = _dt_con_hora(dt, hora_ini[0], hora_ini[1])
-    hf = _dt_con_hora(dt, hora_fin[0], hora_fin[1])
-    if hi <= hf:
-        return hi <= dt < hf
-    else:
-        return not (hf <= dt < hi)
+    hi = _g["hora_ini"]
+    hf = _g["hora_fin"]
+    # Comparación en minuto-del-día: puro entero, sin construir datetimes.
+    m = dt.hour * 60 + dt.minute
+    mi = hi[0] * 60 + hi[1]
+    mf = hf[0] * 60 + hf[1]
+    return (mi <= m < mf) if mi <= mf else not (mf <= m < mi)
 
 def proximo_inicio_desde(dt: datetime) -> datetime:
     global hora_ini, hora_fin
     if esta_dentro_horario(dt):
         return dt
-    if hora_ini == hora_fin:
-        return _dt_con_hora(dt + timedelta(days=1), hora_ini[0], hora_ini[1])
-    if _dt_con_hora(dt, hora_ini[0], hora_ini[1]) > dt:
-        return _dt_con_hora(dt, hora_ini[0], hora_ini[1])
-    return _dt_con_hora(dt + timedelta(days=1), hora_ini[0], hora_ini[1])
+    tabla = _next_start_table
+    if tabla is None or _next_start_key != (hora_ini, hora_fin):
+        tabla = _rebuild_next_start_table()
+    secs = tabla[dt.hour * 60 + dt.minute]
+    return (dt + timedelta(seconds=secs)).replace(second=0, microsecond=0)
+
+# Último (segundo, intervalo) alineado: el scheduler despierta varias veces
+# dentro del mismo segundo y cada .timestamp() consulta la zona horaria.
+_align_cache: tuple[datetime, int, datetime] | None = None
 
 def alinear_a_intervalo(desde: datetime, intervalo_seg: int) -> datetime:
+    global _align_cache
+    sec = desde.replace(microsecond=0)
+    if (
+        _align_cache is not None
+        and _align_cache[0] == sec
+        and _align_cache[1] == intervalo_seg
+    ):
+        return _align_cache[2]
     epoch = int(desde.timestamp())
-    resto = epoch % intervalo_seg
-    if resto == 0:
-        return desde.replace(second=0, microsecond=0)
-    salto = intervalo_seg - resto
-    return desde + timedelta(seconds=salto)
+    # (-epoch) % intervalo da directamente el salto (0 si ya está alineado)
+    salto = (-epoch) % intervalo_seg
+    res = sec.replace(second=0) if not salto else sec + timedelta(seconds=salto)
+    _align_cache = (sec, intervalo_seg, res)
+    return res
@@ -10,7 +10,12 @@
 # 4) INTERFAZ: sin cambios de flujo. "Captura instantánea" mantiene lock anti-colisión.
 # 5) Compatibilidad: no se asume ningún nombre fijo de funciones en analyzer; se resuelven dinámicamente.
 
+import atexit
+import functools
 import os, sys, re, time, threading, tempfile, json, logging, logging.handlers
+import queue
+from collections import deque
+from operator import itemgetter
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from datetime import datetime, timedelta
@@ -46,7 +51,15 @@ except Exception:
     handler = logging.StreamHandler(stream=sys.stdout)
 handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s"))
 if not logger.handlers:
-    logger.addHandler(handler)
+    # El hilo de la GUI (y el del ciclo) solo encolan; el listener escribe
+    # al archivo rotatorio en su propio hilo, sin bloquear capturas.
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 logger.info("GUI iniciada")
 
 # ====== Debug temprano (diagnóstico de arranque) ======
@@ -320,16 +333,49 @@ def _bootstrap_startup():
             cfg["excel_path"] = ruta
             save_cfg(cfg)
     else:
-        try:
-            wb = openpyxl.load_workbook(ruta)
-        except Exception as e:
-            messagebox.showerror("Excel", f"No se pudo abrir el Excel configurado:\n{e}")
-        else:
-            if "Tráfico inusual" not in wb.sheetnames:
-                ws = wb.create_sheet("Tráfico inusual")
-                _poner_encabezados(ws)
-            safe_save_workbook(wb, ruta)
-            set_workbook(wb, ruta)
+        # Cargar el workbook en un hilo aparte: con meses de capturas la
+        # carga tarda segundos y congelaba la GUI antes de la primera
+        # captura. Solo el set_workbook final regresa al hilo de Tk.
+        resultado_q = queue.SimpleQueue()
+
+        def _open_wb_worker():
+            try:
+                # Sondeo barato: read_only no materializa celdas, solo el
+                # índice de hojas.
+                probe = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+                tiene_hoja = "Tráfico inusual" in probe.sheetnames
+                probe.close()
+                # El workbook completo sigue haciendo falta en memoria:
+                # guardar_tramos hace append sobre él en cada captura.
+                # keep_links/rich_text fuera: ramas del parser que no usamos.
+                wb = openpyxl.load_workbook(ruta, keep_links=False, rich_text=False)
+                modified = False
+                if not tiene_hoja:
+                    ws = wb.create_sheet("Tráfico inusual")
+                    _poner_encabezados(ws)
+                    modified = True
+                # Guardar SOLO si hubo mutación; si la hoja ya existía,
+                # re-escribir el xlsx entero al arrancar era I/O inútil.
+                if modified:
+                    safe_save_workbook(wb, ruta)
+                resultado_q.put((wb, None))
+            except Exception as e:
+                resultado_q.put((None, e))
+
+        threading.Thread(target=_open_wb_worker, daemon=True).start()
+
+        def _drain_wb_queue():
+            try:
+                wb, err = resultado_q.get_nowait()
+            except Exception:
+                root.after(50, _drain_wb_queue)
+                return
+            if err is not None:
+                messagebox.showerror("Excel", f"No se pudo abrir el Excel configurado:\n{err}")
+            else:
+                set_workbook(wb, ruta)
+
+        root.after(50, _drain_wb_queue)
 
     # 2) Arrancar Chrome/Waze
     try:
@@ -338,40 +384,40 @@ def _bootstrap_startup():
         messagebox.showerror("Navegador", f"No se pudo iniciar el navegador con Selenium:\n{e}")
 
 # ====== IMPORTS del proyecto ======
-from storage import ruta_log_txt, safe_save_workbook  # log y guardado seguro
+from storage import ruta_log_txt, safe_save_workbook, guardar_tramos, flush_guardado  # log y guardado seguro
 from config import (
     modo_247, hora_ini, hora_fin, intervalo_captura_sugerido,
     set_runtime_period_minutes, get_runtime_period_seconds,
     esta_dentro_horario, proximo_inicio_desde, alinear_a_intervalo
 )
-try:
-    from storage import wb, archivo_excel
-except Exception:
-    wb = None
-    archivo_excel = None
-
 # Resolver funciones del analyzer sin conocer sus nombres exactos
 import analyzer as _an
 
+@functools.lru_cache(maxsize=None)
 def _resolve_fn(possible_names):
     for name in possible_names:
         fn = getattr(_an, name, None)
         if callable(fn):
-            logger.info(f"[GUI] Usando analyzer.{name}()")
+            logger.info("[GUI] Usando analyzer.%s()", name)
             return fn
     raise ImportError(f"No se encontró ninguna de estas funciones en analyzer.py: {possible_names}")
 
 # Detectar/extract crudos (sin guardar)
-analyzer_detect_all = _resolve_fn([
+analyzer_detect_all = _resolve_fn((
     "detect_all_segments", "detect_segments", "extract_segments",
     "capturar_todos_los_tramos", "extraer_tramos", "listar_tramos", "scan_segments"
-])
+))
 
 # Capturar+guardar (retorna tuple: guardados, usuales, inusuales)
-analyzer_capture_and_save = _resolve_fn([
+analyzer_capture_and_save = _resolve_fn((
     "capture_and_save", "capturar_y_guardar", "procesar_y_guardar_tramos",
     "run_capture", "save_capture"
-])
+))
+
+# Referencias ligadas para los caminos calientes: evita el lookup de
+# Logger.info por llamada y permite saltarse el enqueue si INFO está apagado.
+_info = logger.info
+_log_info_enabled = logger.isEnabledFor(logging.INFO)
 
 # ====== Estado global GUI ======
 stop_event = threading.Event()
@@ -390,10 +436,62 @@ vista_raw_activa = False
 win_raw = None
 text_raw = None
 
-def _append_to_text(text_widget, line: str):
+# Buffers de líneas pendientes: los productores solo encolan; un único
+# after_idle por ventana vacía el buffer con UN insert (no uno por línea).
+# Tope de líneas por ventana de logs: sin esto, tras horas de capturas el
+# Text acumula miles de líneas y cada insert/see recorre un árbol creciente.
+MAX_LINES = 2000
+
+# El buffer de crudos es acotado: si la ventana pasa oculta mucho tiempo,
+# solo retenemos lo que cabría en pantalla de todos modos.
+_raw_pending: deque = deque(maxlen=MAX_LINES)
+_cls_pending: deque = deque()
+_flush_scheduled = {"raw": False, "cls": False}
+
+def _pegado_al_fondo(text_widget) -> bool:
+    try:
+        return text_widget.yview()[1] >= 0.999
+    except Exception:
+        return True
+
+def _recortar_y_scroll(text_widget, pinned: bool):
+    """Recorta el excedente sobre MAX_LINES con UN delete por rango y solo
+    auto-desplaza si el usuario ya estaba en el fondo."""
+    try:
+        exceso = int(float(text_widget.index("end-1c"))) - 1 - MAX_LINES
+        if exceso > 0:
+            text_widget.delete("1.0", f"{exceso + 1}.0")
+        if pinned:
+            text_widget.see("end")
+    except Exception:
+        pass
+
+def _programar_flush(clave: str, fn):
+    if _flush_scheduled[clave]:
+        return
+    _flush_scheduled[clave] = True
+    try:
+        root.after_idle(fn)
+    except Exception:
+        _flush_scheduled[clave] = False
+
+def _flush_cls():
+    _flush_scheduled["cls"] = False
+    if not _cls_pending:
+        return
+    if text_cls is None:
+        _cls_pending.clear()
+        return
+    # Un solo timestamp por flush: dentro del mismo tick las líneas
+    # comparten segundo, no hay que formatearlo N veces
+    ts = datetime.now().strftime("%H:%M:%S")
+    lineas = []
+    while _cls_pending:
+        lineas.append(f"[{ts}] {_cls_pending.popleft()}")
     try:
-        text_widget.insert("end", line + "\n")
-        text_widget.see("end")
+        pinned = _pegado_al_fondo(text_cls)
+        text_cls.insert("end", "\n".join(lineas) + "\n")
+        _recortar_y_scroll(text_cls, pinned)
     except Exception:
         pass
 
@@ -426,11 +524,12 @@ def abrir_logs_clasificacion():
     win_cls.protocol("WM_DELETE_WINDOW", on_close)
 
 def log_clasificacion(mensaje: str):
-    logger.info(mensaje)
+    if _log_info_enabled:
+        _info(mensaje)
     if not vista_cls_activa or text_cls is None:
         return
-    ts = datetime.now().strftime("%H:%M:%S")
-    root.after(0, lambda: _append_to_text(text_cls, f"[{ts}] {mensaje}"))
+    _cls_pending.append(mensaje)
+    _programar_flush("cls", _flush_cls)
 
 # -------- Crudos --------
 def abrir_logs_crudos():
@@ -446,6 +545,10 @@ def abrir_logs_crudos():
     win_raw.geometry("900x520")
     text_raw = scrolledtext.ScrolledText(win_raw, wrap="word", font=("Consolas", 10))
     text_raw.pack(fill="both", expand=True, padx=8, pady=8)
+    # Tags configurados UNA vez al crear la ventana, no en cada flush
+    _ensure_text_tags(text_raw)
+    # Al volver a ser visible, volcar lo que se acumuló mientras estaba oculta
+    win_raw.bind("<Map>", lambda _e: _programar_flush("raw", _flush_raw))
     frm_btn = tk.Frame(win_raw); frm_btn.pack(fill="x", padx=8, pady=(0,8))
     tk.Button(frm_btn, text="Limpiar", command=lambda: text_raw.delete("1.0","end")).pack(side="left")
     def copiar():
@@ -478,45 +581,49 @@ def _ensure_text_tags(widget):
     widget.tag_config("c_purple", foreground="#7C3AED")  # velocidad (km/h")
 
 
-def _apply_color(text_widget, line_start_index, pattern, tag_name):
-    """
-    Colorea todas las coincidencias de 'pattern' (regex) **solo en esa línea**,
-    calculando offsets con '+Nc' desde el inicio de la línea.
-    """
-    import re as _re
+# Esqueleto HTML invariante de la línea de crudo, troceado en los puntos
+# donde se intercalan campos. Constantes (y sus longitudes) a nivel módulo:
+# el ensamblado por línea queda en appends y sumas de enteros.
+_HTML_A = (
+    '<app-traffic-view-route><app-traffic-view-sidebar-section>'
+    '<div class="route-info-container"><div class="basic-info">'
+    '<wz-subhead4><span style="color:#1E40AF">'
+)
+_HTML_B = '</span></wz-subhead4><wz-caption class="route-distance"><span style="color:#EA580C">'
+_HTML_C = (
+    '</span></wz-caption></div><div class="traffic-info"><app-traffic-view-route-stats>'
+    '<wz-caption class="current-stat"><span style="color:#16A34A">'
+)
+_HTML_VEL = ' | <span style="color:#7C3AED">'
+_HTML_HIST = '</wz-caption><wz-caption class="historic-stat">'
+_HTML_FIN = (
+    '</wz-caption></app-traffic-view-route-stats></div>'
+    '<div class="route-menu"><wz-menu><wz-menu-item> Edit </wz-menu-item>'
+    '<wz-menu-item> Delete route </wz-menu-item></wz-menu></div>'
+    '</div></app-traffic-view-sidebar-section></app-traffic-view-route>\n'
+)
+_LEN_A = len(_HTML_A)
+_LEN_B = len(_HTML_B)
+_LEN_C = len(_HTML_C)
+_LEN_VEL = len(_HTML_VEL)
+_LEN_SPAN_FIN = len("</span>")
 
-    # Texto de esa línea nada más
-    line_text = text_widget.get(line_start_index, f"{line_start_index} lineend")
 
-    for m in _re.finditer(pattern, line_text):
-        a, b = m.span()
-        # Índices seguros usando offsets sobre el linestart
-        start_idx = f"{line_start_index}+{a}c"
-        end_idx   = f"{line_start_index}+{b}c"
-        try:
-            text_widget.tag_add(tag_name, start_idx, end_idx)
-        except Exception:
-            # No dejamos que un fallo en un match interrumpa el resto
-            pass
+@functools.lru_cache(maxsize=4096)
+def _esc(s: str) -> str:
+    # Los mismos nombres/distancias/tiempos se repiten captura tras captura
+    # (los tramos de Waze son estables): escapar cada string único una vez.
+    import html
+    return html.escape(s)
 
 
-def _insert_crudo_with_colors(item: dict):
+def _build_crudo_line(item: dict, ts: str):
     """
-    Inserta UNA línea HTML (mock) en la vista 'Crudos' y aplica color a:
-      - Nombre (azul)
-      - Distancia (naranja)
-      - Tiempo (min) actual (verde)
-      - Velocidad (km/h) actual (morado)
-    Usa índices 'end-1c linestart' + offsets para evitar TclError.
+    Construye UNA línea HTML (mock) para la vista 'Crudos' y, de paso, los
+    spans de color (inicio, fin, tag) de cada campo. El productor ya sabe
+    dónde queda cada campo al ensamblar: no hay que redescubrirlo con regex.
+    `ts` llega ya formateado (uno por flush, no por línea).
     """
-    from datetime import datetime
-    import html
-
-    if text_raw is None:
-        return
-
-    _ensure_text_tags(text_raw)
-
     # Campos
     nombre = (item.get("nombre") or item.get("name") or "").strip()
     dist   = (item.get("dist_raw") or item.get("dist") or "").strip()
@@ -524,85 +631,100 @@ def _insert_crudo_with_colors(item: dict):
     hist   = (item.get("historic_raw") or item.get("historic") or "").strip()
 
     # Escapar por seguridad (aunque es mock HTML)
-    nombre_e = html.escape(nombre)
-    dist_e   = html.escape(dist)
-    curr_e   = html.escape(curr)
-    hist_e   = html.escape(hist)
-
-    ts = datetime.now().strftime("%H:%M:%S")
-
-    # Línea “HTML” (como la que me mostraste). Pongo spans con estilos,
-    # pero el color real lo damos con tags del Text (esto es “decorativo”).
-    line = (
-        f"[{ts}] "
-        f"<app-traffic-view-route><app-traffic-view-sidebar-section>"
-        f"<div class=\"route-info-container\">"
-        f"<div class=\"basic-info\">"
-        f"<wz-subhead4><span style=\"color:#1E40AF\">{nombre_e}</span></wz-subhead4>"
-        f"<wz-caption class=\"route-distance\"><span style=\"color:#EA580C\">{dist_e}</span></wz-caption>"
-        f"</div>"
-        f"<div class=\"traffic-info\"><app-traffic-view-route-stats>"
-        f"<wz-caption class=\"current-stat\"><span style=\"color:#16A34A\">{curr_e.split('|')[0].strip()}</span>"
-        f"{(' | <span style=\"color:#7C3AED\">' + curr_e.split('|')[1].strip() + '</span>') if '|' in curr_e else ''}"
-        f"</wz-caption>"
-        f"<wz-caption class=\"historic-stat\">{hist_e}</wz-caption>"
-        f"</app-traffic-view-route-stats></div>"
-        f"<div class=\"route-menu\"><wz-menu><wz-menu-item> Edit </wz-menu-item>"
-        f"<wz-menu-item> Delete route </wz-menu-item></wz-menu></div>"
-        f"</div></app-traffic-view-sidebar-section></app-traffic-view-route>\n"
-    )
-
-    # Insertar al final
-    text_raw.insert("end", line)
-
-    # Inicio de la línea recién insertada (índice robusto)
-    line_start = text_raw.index("end-1c linestart")
-
-    # Patrones a resaltar (solo en ESTA línea):
-    # 1) Nombre dentro del subhead (azul)
-    if nombre:
-        _apply_color(
-            text_raw,
-            line_start,
-            rf"<wz-subhead4>\s*{re.escape(nombre_e)}\s*|<wz-subhead4><span[^>]*>{re.escape(nombre_e)}</span>\s*</wz-subhead4>",
-            "c_blue",
-        )
-
-    # 2) Distancia (naranja): número + ' km'
-    #    Tomamos la cifra dentro de route-distance, o cualquier 'X.xx km' de la línea
-    _apply_color(
-        text_raw,
-        line_start,
-        r"\b\d+(?:[.,]\d+)?\s*km\b",
-        "c_orange",
-    )
-
-    # 3) Tiempo actual (verde): "<n> min"
-    _apply_color(
-        text_raw,
-        line_start,
-        r"\b\d+\s*min(?:utos)?\b",
-        "c_green",
-    )
-
-    # 4) Velocidad actual (morado): "##.## km/h"
-    _apply_color(
-        text_raw,
-        line_start,
-        r"\b\d+(?:[.,]\d+)?\s*km/?h\b",
-        "c_purple",
-    )
-
-    # Desplazar el scroll al final
+    nombre_e = _esc(nombre)
+    dist_e   = _esc(dist)
+    curr_e   = _esc(curr)
+    hist_e   = _esc(hist)
+
+    # Línea “HTML” ensamblada por partes; `pos` lleva el offset en caracteres
+    # y cada campo coloreado registra su span exacto. Partition corta el
+    # stat actual una sola vez (tiempo | velocidad).
+    tiempo, sep, vel = curr_e.partition("|")
+    tiempo = tiempo.strip()
+
+    spans: list = []
+    parts = [f"[{ts}] ", _HTML_A, nombre_e, _HTML_B, dist_e, _HTML_C, tiempo, "</span>"]
+
+    pos = len(ts) + 3 + _LEN_A  # "[" + ts + "] " = len(ts) + 3
+    if nombre_e:
+        spans.append((pos, pos + len(nombre_e), "c_blue"))
+    pos += len(nombre_e) + _LEN_B
+    if dist_e:
+        spans.append((pos, pos + len(dist_e), "c_orange"))
+    pos += len(dist_e) + _LEN_C
+    if tiempo:
+        spans.append((pos, pos + len(tiempo), "c_green"))
+    pos += len(tiempo) + _LEN_SPAN_FIN
+
+    if sep:
+        vel = vel.strip()
+        parts.append(_HTML_VEL)
+        parts.append(vel)
+        parts.append("</span>")
+        pos += _LEN_VEL
+        if vel:
+            spans.append((pos, pos + len(vel), "c_purple"))
+
+    parts.append(_HTML_HIST)
+    parts.append(hist_e)
+    parts.append(_HTML_FIN)
+
+    return "".join(parts), spans
+
+
+def _flush_raw():
+    """Vacía el buffer de crudos con UN solo insert y colorea en segunda pasada."""
+    _flush_scheduled["raw"] = False
+    if not _raw_pending:
+        return
+    if text_raw is None:
+        _raw_pending.clear()
+        return
+    try:
+        # Ventana minimizada u oculta: no pagamos todo el pipeline de
+        # coloreado por líneas que nadie ve; el deque retiene lo pendiente
+        # y el evento <Map> lo vuelca al volver a ser visible.
+        if not text_raw.winfo_viewable():
+            return
+    except Exception:
+        pass
+    items = []
+    while _raw_pending:
+        items.append(_raw_pending.popleft())
     try:
-        text_raw.see("end")
+        ts = datetime.now().strftime("%H:%M:%S")
+        construidas = [_build_crudo_line(it, ts) for it in items]
+        # Línea donde empieza el bloque (el Text siempre termina en \n)
+        pinned = _pegado_al_fondo(text_raw)
+        base_line = int(float(text_raw.index("end-1c")))
+        text_raw.insert("end", "".join(l for l, _ in construidas))
+        # tag_add acepta varios pares inicio/fin: agrupamos todos los spans
+        # del bloque por tag y hacemos UNA llamada por tag (4 cruces a Tcl
+        # por flush en vez de 4 por línea).
+        por_tag: dict = {}
+        for i, (_l, spans) in enumerate(construidas):
+            line_start = f"{base_line + i}.0"
+            for a, b, tag in spans:
+                rangos = por_tag.get(tag)
+                if rangos is None:
+                    rangos = por_tag[tag] = []
+                rangos.append(f"{line_start}+{a}c")
+                rangos.append(f"{line_start}+{b}c")
+        for tag, rangos in por_tag.items():
+            try:
+                text_raw.tag_add(tag, *rangos)
+            except Exception:
+                pass
+        # Recortar al final, después de colorear (el delete corre las líneas)
+        _recortar_y_scroll(text_raw, pinned)
     except Exception:
         pass
 
 def log_crudo(item: dict):
     if not vista_raw_activa or text_raw is None:
         return
-    root.after(0, lambda: _insert_crudo_with_colors(item))
+    _raw_pending.append(item)
+    _programar_flush("raw", _flush_raw)
 
 
 # ====== UI helpers ======
@@ -622,74 +744,62 @@ def _post_captura_ui(guardados: int, usuales: int, inusuales: int, desconocidos:
         pass
 
 # ====== Clasificación desde crudos (sin estados/jam-level) ======
-def _clasif_from_raw(item: dict):
-    """
-    True -> USUAL (Watchlist)
-    False -> INUSUAL (sección Unusual traffic)
-    None -> Desconocido (sin flag)
-    """
-    flag = (item.get("section_flag") or item.get("section") or "").strip().lower()
-    if flag == "unusual":
-        return False
-    if flag == "watch":
-        return True
-    if "es_usual" in item:
-        v = item.get("es_usual")
-        if v is True: return True
-        if v is False: return False
-    return None
-
 def _emitir_crudos_y_clasificacion(tramos):
     """
     Muestra crudos (HTML) y luego imprime una CLASIFICACIÓN ORDENADA por captura:
       1) INUSUALES (alfabético por nombre)
       2) WATCHLIST/USUALES (alfabético por nombre)
       3) DESCONOCIDOS (alfabético por nombre)
-    """
-    if not tramos:
-        return
 
-    # Primero, enviar CRUDOS (uno por uno, en el orden recibido)
-    for t in tramos:
-        log_crudo(t)
-
-    # Luego, clasificación ordenada
+    Una sola pasada: cada tramo se emite como crudo, se clasifica en línea
+    (flag -> es_usual -> desconocido) y cae en su cubeta con el nombre en
+    minúsculas como clave de orden; no se re-parte la línea compuesta al
+    ordenar. Acepta cualquier iterable (incluidos generadores); con una
+    captura vacía simplemente no emite nada.
+    """
     inus = []
     usua = []
     desc = []
     for t in tramos:
-        es = _clasif_from_raw(t)
-        nombre = (t.get("nombre") or t.get("name") or "").strip()
-        dist = (t.get("dist_raw") or t.get("dist") or "").strip()
-        curr = (t.get("current_raw") or t.get("current") or "").strip()
-        hist = (t.get("historic_raw") or t.get("historic") or "").strip()
-        visible = curr or hist
-        linea_base = f"{nombre} | {visible} | {dist}"
+        log_crudo(t)
+
+        get = t.get
+        nombre = (get("nombre") or get("name") or "").strip()
+        dist = (get("dist_raw") or get("dist") or "").strip()
+        curr = (get("current_raw") or get("current") or "").strip()
+        hist = (get("historic_raw") or get("historic") or "").strip()
+        linea_base = f"{nombre} | {curr or hist} | {dist}"
+
+        flag = (get("section_flag") or get("section") or "").strip().lower()
+        if flag == "unusual":
+            es = False
+        elif flag == "watch":
+            es = True
+        else:
+            es = get("es_usual") if "es_usual" in t else None
+
         if es is False:
-            inus.append(linea_base)
+            inus.append((nombre.lower(), linea_base))
         elif es is True:
-            usua.append(linea_base)
+            usua.append((nombre.lower(), linea_base))
         else:
-            desc.append(linea_base)
-
-    def _ordenado(lista):
-        return sorted(lista, key=lambda s: s.split(" | ", 1)[0].lower())
+            desc.append((nombre.lower(), linea_base))
 
-    inus_sorted = _ordenado(inus)
-    usua_sorted = _ordenado(usua)
-    desc_sorted = _ordenado(desc)
-
-    if inus_sorted:
+    _key = itemgetter(0)
+    if inus:
+        inus.sort(key=_key)
         log_clasificacion("── Inusuales (alfabético) ──")
-        for x in inus_sorted:
+        for _, x in inus:
             log_clasificacion("[INUSUAL] " + x)
-    if usua_sorted:
+    if usua:
+        usua.sort(key=_key)
         log_clasificacion("── Watchlist (alfabético) ──")
-        for x in usua_sorted:
+        for _, x in usua:
             log_clasificacion("[USUAL] " + x)
-    if desc_sorted:
+    if desc:
+        desc.sort(key=_key)
         log_clasificacion("── Desconocidos (alfabético) ──")
-        for x in desc_sorted:
+        for _, x in desc:
             log_clasificacion("[?] " + x)
 
 # ====== Captura principal ======
@@ -699,8 +809,10 @@ def _captura_ejecucion():
 
     # 1) EXTRAER crudos (sin guardar) → imprimir crudos y clasificación ordenada
     tramos_crudos = det.detect_all()
+    # Generador: _emitir_* itera una sola vez, no hace falta materializar
+    # una segunda lista de dicts junto a tramos_crudos
     _emitir_crudos_y_clasificacion(
-        [t.__dict__ if hasattr(t, "__dict__") else t for t in tramos_crudos]
+        t.as_dict() if hasattr(t, "as_dict") else t for t in tramos_crudos
     )
 
     # Conteo de desconocidos
@@ -710,43 +822,58 @@ def _captura_ejecucion():
         desconocidos = 0
 
     # 2) Guardar en Excel y devolver contadores
-    from storage import guardar_tramos
     guardados, cont_usuales, cont_inusuales = guardar_tramos(tramos_crudos)
 
     return guardados, cont_usuales, cont_inusuales, desconocidos
 
 def captura_instantanea():
-    if captura_lock.locked():
+    # Adquisición no bloqueante: sin ventana entre "¿está tomado?" y "tomar"
+    # (una captura del ciclo ya no puede colarse en medio) y sin hilos que
+    # se queden bloqueados esperando el lock.
+    if not captura_lock.acquire(blocking=False):
         messagebox.showinfo("Captura en curso", "Ya hay una captura ejecutándose.")
         return
     def _run():
-        with captura_lock:
-            try:
-                _refresh_browser("instantánea")
-                log_clasificacion("▶️ Captura instantánea solicitada")
-                g, u, i, d = _captura_ejecucion()
-                _post_captura_ui(g, u, i, d)
-                log_clasificacion(f"✔️ Instantánea lista. Guardados={g} (Usuales={u}, Inusuales={i}, Desconocidos={d})")
-            except Exception as e:
-                log_clasificacion(f"❌ Error en captura instantánea: {e}")
+        try:
+            _refresh_browser("instantánea")
+            log_clasificacion("▶️ Captura instantánea solicitada")
+            g, u, i, d = _captura_ejecucion()
+            _post_captura_ui(g, u, i, d)
+            log_clasificacion(f"✔️ Instantánea lista. Guardados={g} (Usuales={u}, Inusuales={i}, Desconocidos={d})")
+        except Exception as e:
+            log_clasificacion(f"❌ Error en captura instantánea: {e}")
+        finally:
+            captura_lock.release()
     threading.Thread(target=_run, daemon=True).start()
 
 # ====== Hilo del ciclo ======
 def ciclo():
     global siguiente_captura, refrescado_este_ciclo
-    while not stop_event.is_set():
+    # Bucle de vida larga: ligar lo caliente a locales convierte los
+    # LOAD_GLOBAL de cada vuelta en LOAD_FAST
+    _now = datetime.now
+    _delta = timedelta
+    _stop = stop_event.is_set
+    _wait = stop_event.wait
+    _dentro = esta_dentro_horario
+    _prox = proximo_inicio_desde
+    _align = alinear_a_intervalo
+    _period = get_runtime_period_seconds
+
+    while not _stop():
         try:
-            ahora = datetime.now()
-            if not esta_dentro_horario(ahora):
-                siguiente_captura = alinear_a_intervalo(
-                    proximo_inicio_desde(ahora), get_runtime_period_seconds()
-                )
+            ahora = _now()
+            if not _dentro(ahora):
+                siguiente_captura = _align(_prox(ahora), _period())
                 refrescado_este_ciclo = False
-                time.sleep(1)
+                # Fuera de horario: dormir hasta 60 s por vuelta (wait sale
+                # de inmediato si piden detener), no despertar cada segundo
+                pausa = (siguiente_captura - ahora).total_seconds()
+                _wait(min(60.0, max(1.0, pausa)))
                 continue
 
             if siguiente_captura is None:
-                siguiente_captura = alinear_a_intervalo(ahora, get_runtime_period_seconds())
+                siguiente_captura = _align(ahora, _period())
 
             restante = (siguiente_captura - ahora).total_seconds()
 
@@ -764,13 +891,20 @@ def ciclo():
                             _post_captura_ui(g, u, i, d)
                         except Exception as e:
                             log_clasificacion(f"⚠️ Error en ciclo: {e}")
-                siguiente_captura = ahora + timedelta(seconds=get_runtime_period_seconds())
+                siguiente_captura = ahora + _delta(seconds=_period())
                 refrescado_este_ciclo = False
 
-            time.sleep(1)
+            # Sueño adaptativo: lejos de la captura (y ya fuera de la ventana
+            # de refresh t-60s) dormimos hasta acercarnos; cerca, sondeo de 1 s.
+            # Tope de 60 s para notar cambios de periodicidad en runtime.
+            restante = (siguiente_captura - _now()).total_seconds()
+            if restante > 61.0 and refrescado_este_ciclo is False:
+                _wait(min(restante - 60.0, 60.0))
+            else:
+                _wait(1.0)
         except Exception as e:
             log_clasificacion(f"Loop warning: {e}")
-            time.sleep(2)
+            _wait(2.0)
 
 
 # ====== Ventana principal ======
@@ -796,25 +930,38 @@ btn_shot.pack(side="left", padx=(0,10))
 
 def detener():
     stop_event.set()
-    try:
-        if wb and archivo_excel:
-            try:
-                safe_save_workbook(wb, archivo_excel)
-            except Exception:
-                pass
-    except Exception:
-        pass
-
     try:
         from analyzer import shutdown_detectors
         shutdown_detectors()
     except Exception:
         pass
 
+    # Flush final en el hilo escritor de storage: el mainloop no se queda
+    # bloqueado detrás de los reintentos de save; se sondea con after().
     try:
-        root.destroy()
+        from storage import cerrar_guardado_async, guardado_cerrado
+        cerrar_guardado_async()
     except Exception:
-        pass
+        try:
+            flush_guardado()
+        except Exception:
+            pass
+        try:
+            root.destroy()
+        except Exception:
+            pass
+        return
+
+    def _esperar_cierre(intentos=100):
+        if guardado_cerrado() or intentos <= 0:
+            try:
+                root.destroy()
+            except Exception:
+                pass
+        else:
+            root.after(100, _esperar_cierre, intentos - 1)
+
+    _esperar_cierre()
 
 btn_detener = tk.Button(frm_btns, text="Detener Captura", command=detener, bg="red", fg="white")
 btn_detener.pack(side="left")
@@ -876,23 +1023,29 @@ siguiente_captura = alinear_a_intervalo(
 )
 
 # Actualizador del contador
+_contador_last_text = None
+
 def actualizar_contador():
+    global _contador_last_text
     if stop_event.is_set():
         return
-    ahora = datetime.now()
+    ahora = datetime.now()  # una sola lectura por tick, compartida por ambos cálculos
     if not esta_dentro_horario(ahora):
         proximo = alinear_a_intervalo(proximo_inicio_desde(ahora), get_runtime_period_seconds())
         restante = int((proximo - ahora).total_seconds())
-        lbl_contador.config(
-            text=f"⏸️ Pausa por horario — próxima ventana: {proximo.strftime('%H:%M')} (en {restante//60:02d}:{restante%60:02d})"
-        )
+        texto = f"⏸️ Pausa por horario — próxima ventana: {proximo.strftime('%H:%M')} (en {restante//60:02d}:{restante%60:02d})"
+    elif siguiente_captura is None:
+        texto = "⏳ Próxima captura en: --"
     else:
-        if siguiente_captura is None:
-            lbl_contador.config(text="⏳ Próxima captura en: --")
-        else:
-            restante = int((siguiente_captura - ahora).total_seconds())
-            lbl_contador.config(text=f"⏳ Próxima captura en: {_fmt_restante(restante)}")
-    root.after(1000, actualizar_contador)
+        restante = int((siguiente_captura - ahora).total_seconds())
+        texto = f"⏳ Próxima captura en: {_fmt_restante(restante)}"
+    # Tk solo se toca si el texto visible cambió
+    if texto != _contador_last_text:
+        _contador_last_text = texto
+        lbl_contador.config(text=texto)
+    # Re-programación alineada al segundo: after(1000) fijo acumula deriva
+    # con la latencia del propio handler bajo carga de Tk
+    root.after(max(50, 1000 - int((time.monotonic() * 1000.0) % 1000)), actualizar_contador)
 actualizar_contador()
 
 # Hilo del ciclo
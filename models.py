@@ -2,7 +2,8 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-import re
+import functools
+import hashlib
 from typing import Optional
 
 WAZE_URL_DEF = "https://www.waze.com/partnerhub/map-tool?lon=-100.21739443678854&lat=25.65732647938037"
@@ -36,8 +37,9 @@ class AppConfig:
         return (int(self.hora_fin_h) % 24, int(self.hora_fin_m) % 60)
 
 
-@dataclass
+@dataclass(slots=True)
 class TramoNorm:
+    # slots=True: sin __dict__ por instancia (cientos de tramos × capturas)
     nombre: str
     dist_km: float | None
     tiempo_min: int | None
@@ -51,37 +53,42 @@ class TramoNorm:
     dist_raw: str = ""
     raw: str = ""
 
+    def as_dict(self) -> dict:
+        from dataclasses import asdict
+        return asdict(self)
+
 
 # ----------------- Utilidades de horario -----------------
 def _dt_con_hora(base: datetime, hh: int, mm: int) -> datetime:
     return base.replace(hour=hh, minute=mm, second=0, microsecond=0)
 
 def esta_dentro_horario(cfg: AppConfig, dt: datetime) -> bool:
+    # Comparación por minuto-del-día (enteros): sin construir los datetime
+    # de los límites en cada llamada
     if cfg.modo_247:
         return True
-    hi = _dt_con_hora(dt, *cfg.hora_ini_tuple())
-    hf = _dt_con_hora(dt, *cfg.hora_fin_tuple())
-    if hi <= hf:
-        return hi <= dt < hf
-    else:
-        return not (hf <= dt < hi)
+    hi_h, hi_m = cfg.hora_ini_tuple()
+    hf_h, hf_m = cfg.hora_fin_tuple()
+    mi = hi_h * 60 + hi_m
+    mf = hf_h * 60 + hf_m
+    m = dt.hour * 60 + dt.minute
+    return (mi <= m < mf) if mi <= mf else not (mf <= m < mi)
 
 def proximo_inicio_desde(cfg: AppConfig, dt: datetime) -> datetime:
-    hi_h, hi_m = cfg.hora_ini_tuple()
     if esta_dentro_horario(cfg, dt):
         return dt
-    if (hi_h, hi_m) == cfg.hora_fin_tuple():
-        return _dt_con_hora(dt + timedelta(days=1), hi_h, hi_m)
-    if _dt_con_hora(dt, hi_h, hi_m) > dt:
-        return _dt_con_hora(dt, hi_h, hi_m)
-    return _dt_con_hora(dt + timedelta(days=1), hi_h, hi_m)
+    hi_h, hi_m = cfg.hora_ini_tuple()
+    inicio = _dt_con_hora(dt, hi_h, hi_m)
+    # Ventana vacía (ini == fin) o inicio ya pasado → siguiente día
+    if (hi_h, hi_m) == cfg.hora_fin_tuple() or inicio <= dt:
+        inicio += timedelta(days=1)
+    return inicio
 
 def alinear_a_intervalo(desde: datetime, intervalo_seg: int) -> datetime:
-    epoch = int(desde.timestamp())
-    resto = epoch % intervalo_seg
-    if resto == 0:
+    salto = (-int(desde.timestamp())) % intervalo_seg
+    if salto == 0:
         return desde.replace(second=0, microsecond=0)
-    return desde + timedelta(seconds=(intervalo_seg - resto))
+    return desde + timedelta(seconds=salto)
 
 def siguiente_captura_inicial(cfg: AppConfig, intervalo_seg: int) -> datetime:
     ahora = datetime.now()
@@ -98,15 +105,22 @@ def fmt_restante(segundos: int) -> str:
 
 
 # ----------------- Utilidades de nombres -----------------
-_sheet_forbidden = r'[:\\/*?\[\]]'
+# Tabla C-level para los caracteres prohibidos (antes: re.sub por llamada)
+_sheet_forbidden_table = str.maketrans({c: " " for c in ':\\/*?[]'})
+
+@functools.lru_cache(maxsize=4096)
 def nombre_hoja_seguro(nombre_original: str) -> str:
     """
     Excel limita a 31 chars y prohíbe : \ / ? * [ ].
     Hacemos un hash corto para evitar colisiones con truncado.
+    Cacheada: los mismos nombres de tramo se repiten captura tras captura.
     """
     base = (nombre_original or "").strip()
     base = base.replace(":", " -").replace("/", " /")
-    base = re.sub(_sheet_forbidden, " ", base)
+    base = base.translate(_sheet_forbidden_table)
     base = base[:27]  # deja espacio sufijo
-    suf = f"_{abs(hash(nombre_original))%1000:03d}"
+    # blake2b y no hash(): hash() está salado por proceso, así que el sufijo
+    # cambiaba en cada arranque y el mismo tramo acumulaba hojas duplicadas
+    digest = hashlib.blake2b((nombre_original or "").encode("utf-8"), digest_size=2).digest()
+    suf = f"_{int.from_bytes(digest, 'big') % 1000:03d}"
     return (base + suf)[:31]
@@ -11,63 +11,72 @@
 
 from __future__ import annotations
 
+import bisect
+import contextlib
 import os
+import queue
+import threading
 import time
 import tempfile
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Iterable
+import csv
 import json
+import pickle
 
 def _wal_paths_for(excel_path: str) -> tuple[Path, Path]:
     """
     Calcula rutas de WAL y del marcador de commit para un Excel dado.
-    Usamos: <archivo>.xlsx.wal.jsonl  y  <archivo>.xlsx.wal.jsonl.commit
+    Usamos: <archivo>.xlsx.wal.bin  y  <archivo>.xlsx.wal.bin.commit
+    (versiones previas escribían NDJSON en .wal.jsonl; ver recover_from_wal).
     """
     p = Path(excel_path)
-    wal = Path(str(p) + ".wal.jsonl")
+    wal = Path(str(p) + ".wal.bin")
     mark = Path(str(wal) + ".commit")
-    try:
+    with contextlib.suppress(OSError):
         wal.parent.mkdir(parents=True, exist_ok=True)
-    except Exception:
-        pass
     return wal, mark
 
+def _wal_legacy_paths_for(excel_path: str) -> tuple[Path, Path]:
+    """Rutas del WAL NDJSON de versiones previas (solo para recuperar/limpiar)."""
+    wal = Path(str(Path(excel_path)) + ".wal.jsonl")
+    return wal, Path(str(wal) + ".commit")
+
 def _wal_write_transaction(excel_path: str, tramos_norm: list[dict]) -> None:
-    """Escribe la transacción como NDJSON (1 tramo por línea) y fuerza a disco."""
+    """
+    Escribe TODO lo pendiente como UN frame pickle (protocolo 5): una sola
+    llamada a os.write + fsync, en vez de un json.dump por tramo. Truncar es
+    correcto porque el archivo siempre se reescribe con la lista pendiente
+    completa; no hay transacciones parciales que pisar.
+    """
     wal, _ = _wal_paths_for(excel_path)
-    with open(wal, "w", encoding="utf-8") as f:
-        for t in tramos_norm:
-            json.dump(t, f, ensure_ascii=False)
-            f.write("\n")
-        f.flush()
-        try:
-            os.fsync(f.fileno())
-        except Exception:
-            pass
+    buf = pickle.dumps(tramos_norm, protocol=5)
+    fd = os.open(str(wal), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, buf)
+        # Único fsync por transacción: es el que protege los datos pendientes
+        with contextlib.suppress(OSError):
+            os.fsync(fd)
+    finally:
+        os.close(fd)
 
 def _wal_mark_committed(excel_path: str) -> None:
-    """Crea un marcador de commit; si existe, lo actualiza (touch)."""
+    """
+    Crea un marcador de commit; si existe, lo actualiza (touch).
+    Sin fsync: perder el marcador solo provoca re-aplicar un WAL ya
+    guardado, no pérdida de datos; no vale un flush síncrono de disco.
+    """
     _, mark = _wal_paths_for(excel_path)
-    try:
-        with open(mark, "w", encoding="utf-8") as f:
-            f.write("ok")
-        try:
-            os.fsync(f.fileno())
-        except Exception:
-            pass
-    except Exception:
-        pass
+    with contextlib.suppress(OSError):
+        mark.write_text("ok", encoding="utf-8")
 
 def _wal_clear(excel_path: str) -> None:
-    """Elimina WAL y el marcador de commit."""
+    """Elimina WAL y el marcador de commit (incluye el formato heredado)."""
     wal, mark = _wal_paths_for(excel_path)
-    for p in (wal, mark):
-        try:
-            if p.exists():
-                p.unlink()
-        except Exception:
-            pass
+    for p in (wal, mark, *_wal_legacy_paths_for(excel_path)):
+        with contextlib.suppress(OSError):
+            p.unlink(missing_ok=True)
 
 def recover_from_wal() -> None:
     """
@@ -79,27 +88,35 @@ def recover_from_wal() -> None:
         return
     wal, mark = _wal_paths_for(archivo_excel)
     if not wal.exists():
-        return
+        # WAL NDJSON de una versión previa, si lo hubiera
+        wal, mark = _wal_legacy_paths_for(archivo_excel)
+        if not wal.exists():
+            return
 
     # Si hay commit, significa que ya se alcanzó a guardar y faltó limpiar
     if mark.exists():
         _wal_clear(archivo_excel)
         return
 
-    # Reaplicar
+    # Reaplicar (frame pickle; si no, líneas JSON del formato heredado)
     tramos = []
     try:
-        with open(wal, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    tramos.append(json.loads(line))
-                except Exception:
-                    continue
+        data = wal.read_bytes()
     except Exception:
         return
+    try:
+        cargado = pickle.loads(data)
+        if isinstance(cargado, list):
+            tramos = cargado
+    except Exception:
+        for line in data.decode("utf-8", "replace").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tramos.append(json.loads(line))
+            except Exception:
+                continue
 
     if not tramos:
         _wal_clear(archivo_excel)
@@ -121,29 +138,76 @@ except Exception:
 wb = None  # type: ignore  # openpyxl.Workbook
 archivo_excel: Optional[str] = None
 
+# True cuando el orden de pestañas puede no cumplir la política (se crearon
+# hojas o cambió el workbook); _ordenar_hojas_watchlist no hace nada si es False.
+_orden_dirty: bool = True
+
 def set_workbook(workbook, excel_path: str) -> None:
-    """Permite a otros módulos registrar el workbook y su ruta."""
-    global wb, archivo_excel
+    """
+    Permite a otros módulos registrar el workbook y su ruta. Con
+    workbook=None solo registra la ruta; get_wb() cargará el archivo
+    de forma diferida en el primer guardado.
+    """
+    global wb, archivo_excel, _orden_dirty
     wb = workbook
     archivo_excel = excel_path
+    _orden_dirty = True
+    _headers_ok.clear()
+    # Reaplicar un WAL huérfano ANTES de que una captura nueva lo trunque
+    # con solo sus propios pendientes (el guardado por lotes deja hasta
+    # N capturas únicamente en el WAL si el proceso muere entre flushes).
+    try:
+        recover_from_wal()
+    except Exception:
+        pass
+
+def get_wb():
+    """
+    Devuelve el workbook, cargándolo bajo demanda si solo hay ruta
+    registrada. keep_links/rich_text desactivados: saltan ramas caras del
+    parser que esta app no usa.
+    """
+    global wb, _orden_dirty
+    if wb is None and archivo_excel and os.path.exists(archivo_excel):
+        try:
+            from openpyxl import load_workbook
+            wb = load_workbook(archivo_excel, keep_links=False, rich_text=False)
+            _orden_dirty = True
+            _headers_ok.clear()
+        except Exception:
+            return None
+    return wb
 
 # === Helpers de rutas para logs/archivos ===
 def _dir_escribible(d: Path) -> bool:
     try:
         d.mkdir(parents=True, exist_ok=True)
-        p = d / (".writetest_" + str(os.getpid()))
-        with open(p, "w", encoding="utf-8") as f:
-            f.write("ok")
+        if not os.access(str(d), os.W_OK):
+            return False
+        if os.name != "nt":
+            return True
+        # En Windows os.access puede mentir (ACLs); confirmamos con un touch
+        # real solo en ese caso.
+        p = str(d / (".writetest_" + str(os.getpid())))
         try:
-            p.unlink()
+            fd = os.open(p, os.O_CREAT | os.O_WRONLY | os.O_EXCL)
+            os.close(fd)
+            os.unlink(p)
+            return True
         except Exception:
-            pass
-        return True
+            return False
     except Exception:
         return False
 
+# Directorio de logs resuelto una sola vez: ruta_log_txt se llama en cada
+# captura y probar candidatos son varios syscalls por llamada.
+_log_dir_cache: Optional[Path] = None
+
 def _ruta_log_usuario(filename: str = "captura_waze.log") -> Path:
     """Devuelve una ruta válida y escribible para archivos de log."""
+    global _log_dir_cache
+    if _log_dir_cache is not None:
+        return _log_dir_cache / filename
     candidatos = []
     if os.name == "nt":
         la = os.environ.get("LOCALAPPDATA")
@@ -153,6 +217,7 @@ def _ruta_log_usuario(filename: str = "captura_waze.log") -> Path:
     candidatos.append(Path(tempfile.gettempdir()) / "CapturaWaze")
     for d in candidatos:
         if _dir_escribible(d):
+            _log_dir_cache = d
             return d / filename
     return Path(tempfile.gettempdir()) / filename
 
@@ -184,9 +249,11 @@ def atomic_save_workbook(workbook, ruta: str) -> str:
         raise ValueError("Se requiere 'ruta' para guardar el workbook.")
     dir_ = os.path.dirname(ruta) or "."
     fd, tmp = tempfile.mkstemp(prefix="~waze_", suffix=".xlsx", dir=dir_)
-    os.close(fd)
     try:
-        workbook.save(tmp)
+        # Reutilizamos el fd de mkstemp (antes: close + reopen por nombre) y
+        # escribimos a través de un buffer de 1 MB; openpyxl acepta file-like.
+        with os.fdopen(fd, "wb", buffering=1 << 20) as fh:
+            workbook.save(fh)
         os.replace(tmp, ruta)
         return ruta
     finally:
@@ -196,6 +263,43 @@ def atomic_save_workbook(workbook, ruta: str) -> str:
         except Exception:
             pass
 
+def exportar_xlsx(ruta_destino: Optional[str] = None) -> Optional[str]:
+    """
+    Exporta una copia del workbook en memoria en modo write-only de openpyxl:
+    las filas se serializan en streaming (sin materializar objetos Cell), lo
+    que reduce tiempo y memoria frente a un save normal en libros grandes.
+    El orden de hojas se resuelve con un único pre-ordenamiento de nombres
+    ("Tráfico inusual" primero, watchlist alfabética, "Desconocidos" al final),
+    sin tocar wb._sheets. Devuelve la ruta escrita o None si no hay workbook.
+
+    Nota: write-only no permite reabrir hojas existentes, por eso el camino
+    caliente de captura sigue sobre el workbook normal; este modo se usa solo
+    para producir el archivo final bajo demanda.
+    """
+    if wb is None:
+        return None
+    ruta = ruta_destino or archivo_excel
+    if not ruta:
+        return None
+
+    from openpyxl import Workbook
+
+    inus_name = "Tráfico inusual"
+    desc_name = "Desconocidos"
+    existentes = wb.sheetnames
+    watchlist = sorted(
+        (s for s in existentes if s not in (inus_name, desc_name)),
+        key=str.lower,
+    )
+    orden = [s for s in [inus_name, *watchlist, desc_name] if s in existentes]
+
+    out = Workbook(write_only=True)
+    for nombre in orden:
+        ws_dst = out.create_sheet(nombre)
+        for fila in wb[nombre].iter_rows(values_only=True):
+            ws_dst.append(fila)
+    return atomic_save_workbook(out, str(ruta))
+
 def safe_save_workbook(workbook, ruta: str, intentos: int = 5, espera_s: float = 1.5) -> str:
     """
     Intenta guardar con reintentos (útil si el archivo está brevemente bloqueado).
@@ -216,13 +320,55 @@ def safe_save_workbook(workbook, ruta: str, intentos: int = 5, espera_s: float =
     return ruta
 
 # === Utilidades internas ===
+_ENCABEZADOS = [
+    "Fecha", "Hora", "Tramo",
+    "Tiempo (MM:SS)", "Tiempo (s)",
+    "Velocidad (km/h)", "Distancia (km)"
+]
+
+# Hojas cuyo encabezado ya se verificó/escribió en este workbook: evita
+# re-escanear la fila 1 (materializa 7 celdas) en cada captura.
+_headers_ok: set[str] = set()
+
 def _poner_encabezados(ws):
+    titulo = ws.title
+    if titulo in _headers_ok:
+        return
     if ws.max_row == 1 and all((cell.value is None) for cell in ws[1]):
-        ws.append([
-            "Fecha", "Hora", "Tramo",
-            "Tiempo (MM:SS)", "Tiempo (s)",
-            "Velocidad (km/h)", "Distancia (km)"
-        ])
+        ws.append(_ENCABEZADOS)
+    _headers_ok.add(titulo)
+
+# === Shards CSV append-only ===
+def _csv_dir() -> Optional[Path]:
+    """Carpeta de shards CSV junto al Excel: <base>__CSV/. None si no hay Excel."""
+    if not archivo_excel:
+        return None
+    base = Path(os.path.splitext(archivo_excel)[0])
+    d = base.parent / (base.name + "__CSV")
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+def _csv_append_shards(filas_por_hoja: dict[str, list]) -> None:
+    """
+    Histórico durable inmediato: cada captura agrega O(filas nuevas) a un
+    .csv por hoja, sin re-serializar nada existente. El .xlsx pasa a ser el
+    formato de presentación (guardado por lotes + exportar_xlsx); los shards
+    garantizan que ninguna captura dependa del siguiente save del workbook.
+    """
+    d = _csv_dir()
+    if d is None:
+        return
+    for hoja, filas in filas_por_hoja.items():
+        ruta = d / f"{hoja}.csv"
+        try:
+            nuevo = not ruta.exists() or ruta.stat().st_size == 0
+            with open(ruta, "a", newline="", encoding="utf-8-sig", buffering=1 << 16) as f:
+                w = csv.writer(f)
+                if nuevo:
+                    w.writerow(_ENCABEZADOS)
+                w.writerows(filas)
+        except Exception:
+            continue
 
 def _ordenar_hojas_watchlist():
     """
@@ -230,107 +376,192 @@ def _ordenar_hojas_watchlist():
       [0] "Tráfico inusual"
       [1..N] todas las hojas de watchlist (todas salvo "Tráfico inusual" y "Desconocidos"), orden alfabético
       [última] "Desconocidos" (si existe)
+
+    Solo reconstruye wb._sheets si hubo cambios de hojas desde el último
+    ordenado (_orden_dirty); el reorden usa un dict título→worksheet para
+    ser O(S) en vez de O(S²) de lookups wb[nombre].
     """
-    if wb is None:
+    global _orden_dirty
+    if wb is None or not _orden_dirty:
         return
-    sheets = list(wb.sheetnames)
+    name_to_ws = {ws.title: ws for ws in wb.worksheets}
     inus_name = "Tráfico inusual"
     desc_name = "Desconocidos"
 
     # Garantizar que la de inusual exista
-    if inus_name not in sheets:
+    if inus_name not in name_to_ws:
         ws = wb.create_sheet(inus_name, 0)
         _poner_encabezados(ws)
-        sheets = list(wb.sheetnames)
+        name_to_ws[inus_name] = ws
 
     # Separar categorías
-    watchlist_sheets = [s for s in sheets if s not in (inus_name, desc_name)]
-    watchlist_sheets.sort(key=lambda x: x.lower())
+    watchlist_sheets = [s for s in name_to_ws if s not in (inus_name, desc_name)]
+    watchlist_sheets.sort(key=str.lower)
 
     new_order = [inus_name] + watchlist_sheets
-    if desc_name in sheets:
+    if desc_name in name_to_ws:
         new_order.append(desc_name)
 
     # Asignar nuevo orden
-    wb._sheets = [wb[s] for s in new_order]  # openpyxl internals, aceptado para reordenar
+    wb._sheets = [name_to_ws[s] for s in new_order]  # openpyxl internals, aceptado para reordenar
     # Nota: no cambiamos titles; solo reordenamos.
+    _orden_dirty = False
 
 def _insertar_hoja_watchlist_en_posicion(title: str):
     """
-    Crea una hoja de watchlist con 'title' si no existe, insertándola en la
-    posición correcta para mantener el orden alfabético (después de "Tráfico inusual"
-    y antes de "Desconocidos").
+    Crea una hoja de watchlist con 'title' si no existe, directamente en su
+    posición alfabética (después de "Tráfico inusual" y antes de
+    "Desconocidos") calculada con bisect sobre las claves en minúsculas.
     """
+    global _orden_dirty
     if wb is None:
         return
     inus_name = "Tráfico inusual"
     desc_name = "Desconocidos"
 
-    if title in wb.sheetnames:
+    sheets = wb.sheetnames
+    if title in sheets:
         return  # ya existe
 
-    # Construir lista ordenada de destino
-    existing = [s for s in wb.sheetnames if s not in (inus_name, desc_name)]
-    existing.append(title)
-    existing.sort(key=lambda x: x.lower())
+    # Posición destino: 0 inusual, luego watchlist alfabética
+    claves = sorted(s.lower() for s in sheets if s not in (inus_name, desc_name))
+    target_index = 1 + bisect.bisect_left(claves, title.lower())
 
-    # La posición final debe ser: 0 inusual, luego índice 1.. en el orden de existing
-    target_index = 1 + existing.index(title)
-
-    # Crear la hoja al final y luego moverla a la posición deseada
-    ws = wb.create_sheet(title)
+    ws = wb.create_sheet(title, target_index)
     _poner_encabezados(ws)
+    # El siguiente flush verifica el orden global (cubre workbooks heredados
+    # cuyo orden en disco no cumpliera la política).
+    _orden_dirty = True
+
+# === Guardado por lotes ===
+# Cada captura solo hace append sobre el workbook en memoria; el save real
+# (re-serialización completa del .xlsx, O(filas totales)) se amortiza cada
+# N capturas o M filas. El WAL cubre el hueco entre saves: se reescribe con
+# TODO lo pendiente en cada captura y solo se limpia tras un save exitoso.
+_FLUSH_CADA_CAPTURAS = 6
+_FLUSH_MAX_FILAS = 500
+_capturas_sin_guardar = 0
+_filas_sin_guardar = 0
+_tramos_pendientes: list[dict] = []
+
+def flush_guardado() -> bool:
+    """
+    Fuerza la escritura del .xlsx con lo acumulado en memoria y limpia el WAL.
+    Bloquea mientras dura el save (con sus reintentos); el camino normal pasa
+    por el hilo escritor (solicitar_guardado / cerrar_guardado_async).
+    """
+    global _capturas_sin_guardar, _filas_sin_guardar
+    if wb is None or not archivo_excel:
+        return False
+    with _save_lock:
+        try:
+            _ordenar_hojas_watchlist()
+            safe_save_workbook(wb, archivo_excel)
+        except Exception:
+            return False
+        _capturas_sin_guardar = 0
+        _filas_sin_guardar = 0
+        _tramos_pendientes.clear()
+        _wal_mark_committed(archivo_excel)
+        _wal_clear(archivo_excel)
+        return True
 
-    # Reordenar moviendo el objeto
-    current = list(wb._sheets)
-    current.remove(ws)
-    current.insert(target_index, ws)
-
-    # Mantener "Desconocidos" (si existe) al final
-    if desc_name in wb.sheetnames:
-        ws_desc = wb[desc_name]
-        current = [s for s in current if s is not ws_desc] + [ws_desc]
-
-    # Asegurar que "Tráfico inusual" esté primero
-    ws_inus = wb[inus_name]
-    current = [s for s in current if s is not ws_inus]
-    current.insert(0, ws_inus)
-
-    wb._sheets = current
+# === Hilo escritor ===
+# safe_save_workbook puede dormir hasta 7.5 s en reintentos; eso no debe
+# pasar ni en el hilo de Tk ni en el de captura. Un daemon consume pedidos
+# de una cola y serializa todos los saves detrás de ella.
+_save_queue: queue.Queue = queue.Queue()
+_save_lock = threading.Lock()
+_writer_thread: Optional[threading.Thread] = None
+_writer_done = threading.Event()
+
+def _writer_loop():
+    while True:
+        pedido = _save_queue.get()
+        if pedido is None:
+            break
+        try:
+            flush_guardado()
+        except Exception:
+            pass
+    _writer_done.set()
+
+def _ensure_writer() -> None:
+    global _writer_thread
+    if _writer_thread is None or not _writer_thread.is_alive():
+        _writer_done.clear()
+        _writer_thread = threading.Thread(
+            target=_writer_loop, daemon=True, name="storage-writer"
+        )
+        _writer_thread.start()
+
+def solicitar_guardado() -> None:
+    """Encola un save del .xlsx en el hilo escritor; no bloquea al llamador."""
+    _ensure_writer()
+    if _save_queue.empty():  # coalesce: un pedido en vuelo basta
+        _save_queue.put("save")
+
+def cerrar_guardado_async() -> None:
+    """Encola un flush final y el apagado del hilo escritor; no bloquea."""
+    _ensure_writer()
+    _save_queue.put("save")
+    _save_queue.put(None)
+
+def guardado_cerrado() -> bool:
+    """True cuando el hilo escritor terminó (o nunca llegó a arrancar)."""
+    return _writer_thread is None or _writer_done.is_set()
 
 # === API de guardado ===
-def guardar_tramos(tramos) -> tuple[int, int, int]:
+def guardar_tramos(tramos, _skip_wal: bool = False) -> tuple[int, int, int]:
     """
     Guarda:
       - INUSUAL   (es_usual is False) -> hoja "Tráfico inusual" [siempre en índice 0]
       - USUAL     (es_usual is True)  -> hoja propia por tramo (orden alfabético global)
       - DESCONOC. (es_usual is None)  -> hoja "Desconocidos" [se ubica al final si existe]
     Devuelve: (total_guardados, total_usuales, total_inusuales)
+
+    El .xlsx NO se reescribe en cada llamada: las filas quedan en el workbook
+    en memoria (protegidas por el WAL) y el save se dispara por lotes.
+    Con _skip_wal=True (recuperación) no se reescribe el WAL y se guarda ya.
     """
-    if wb is None or not archivo_excel:
+    global _capturas_sin_guardar, _filas_sin_guardar, _orden_dirty
+    if get_wb() is None or not archivo_excel:
         return 0, 0, 0
 
     from models import nombre_hoja_seguro
     from openpyxl.utils.exceptions import IllegalCharacterError
 
-    # Asegurar hojas base
-    hoja_inus = wb["Tráfico inusual"] if "Tráfico inusual" in wb.sheetnames else wb.create_sheet("Tráfico inusual", 0)
-    _poner_encabezados(hoja_inus)
-
-    # "Desconocidos" se crea solo si aparece alguno
-    hoja_desc = wb["Desconocidos"] if "Desconocidos" in wb.sheetnames else None
-    if hoja_desc:
-        _poner_encabezados(hoja_desc)
+    # Materializar (puede llegar un generador) y registrar en el WAL todo lo
+    # pendiente de volcar a disco, no solo esta captura.
+    tramos = [
+        t if isinstance(t, dict) else (t.as_dict() if hasattr(t, "as_dict") else t)
+        for t in (tramos or [])
+    ]
+    if not tramos:
+        return 0, 0, 0
 
-    guardados = u = i = 0
     ahora = datetime.now()
+    # Fecha/hora formateadas UNA vez por captura (todas las filas comparten
+    # el mismo instante; antes eran 2 strftime por fila)
+    fecha = ahora.strftime("%d/%m/%Y")
+    hora = ahora.strftime("%H:%M:%S")
+    filas_por_hoja: dict[str, list] = {}  # hoja -> filas agregadas en esta llamada
 
     def _val(obj, k, default=None):
         if isinstance(obj, dict):
             return obj.get(k, default)
         return getattr(obj, k, default)
 
-    for t in (tramos or []):
+    # Despacho por clase (es_usual True/False/None) → nombre de hoja destino
+    _a_desconocidos = lambda _n: "Desconocidos"
+    resolver_hoja = {
+        True: nombre_hoja_seguro,
+        False: lambda _n: "Tráfico inusual",
+        None: _a_desconocidos,
+    }
+
+    # 1) Clasificar: una pasada que bucketiza filas por hoja destino
+    for t in tramos:
         nombre = (_val(t, "nombre") or "").strip()
         tiempo_mmss = _val(t, "tiempo_mmss") or ""
         tiempo_seg  = _val(t, "tiempo_seg")
@@ -338,69 +569,86 @@ def guardar_tramos(tramos) -> tuple[int, int, int]:
         dist_km     = _val(t, "dist_km")
         es_usual    = _val(t, "es_usual")  # True / False / None
 
-        try:
-            if es_usual is True:
-                # USUAL → hoja por tramo (orden alfabético en pestañas)
-                hoja = nombre_hoja_seguro(nombre)
-                if hoja not in wb.sheetnames:
+        # Valores normalizados a locales y fila como tupla: más barata de
+        # construir e iterar que una lista (openpyxl y csv aceptan ambas)
+        ts = int(tiempo_seg) if isinstance(tiempo_seg, (int, float)) else ""
+        vel = vel_kmh if vel_kmh is not None else ""
+        dist = dist_km if dist_km is not None else ""
+        fila = (fecha, hora, nombre, tiempo_mmss, ts, vel, dist)
+        hoja = resolver_hoja.get(es_usual, _a_desconocidos)(nombre)
+        filas_por_hoja.setdefault(hoja, []).append(fila)
+
+    # Contadores derivados de los buckets (sin ramas por fila)
+    guardados = sum(map(len, filas_por_hoja.values()))
+    i = len(filas_por_hoja.get("Tráfico inusual", ()))
+    u = guardados - i - len(filas_por_hoja.get("Desconocidos", ()))
+
+    # 2) Volcar: una resolución de worksheet por hoja, no por fila.
+    # El lock evita mutar el workbook mientras el hilo escritor lo serializa.
+    with _save_lock:
+        # El WAL se registra BAJO el lock: si un flush estaba serializando el
+        # workbook, su save aún no contiene estas filas y al terminar limpia
+        # _tramos_pendientes y borra el WAL; registrarlas antes de tomar el
+        # lock dejaba ese hueco sin cobertura hasta el siguiente lote.
+        if not _skip_wal:
+            _tramos_pendientes.extend(t for t in tramos if isinstance(t, dict))
+            try:
+                _wal_write_transaction(archivo_excel, _tramos_pendientes)
+            except Exception:
+                pass
+
+        # wb.sheetnames reconstruye la lista en cada acceso (O(S)); un set
+        # por llamada deja las membresías en O(1)
+        sheet_set = set(wb.sheetnames)
+
+        # Asegurar hoja base (en índice 0)
+        if "Tráfico inusual" not in sheet_set:
+            _poner_encabezados(wb.create_sheet("Tráfico inusual", 0))
+            sheet_set.add("Tráfico inusual")
+            _orden_dirty = True
+        for hoja, filas in filas_por_hoja.items():
+            try:
+                if hoja in sheet_set:
+                    ws = wb[hoja]
+                elif hoja == "Desconocidos":
+                    ws = wb.create_sheet("Desconocidos")
+                    _orden_dirty = True
+                    sheet_set.add(hoja)
+                else:
                     _insertar_hoja_watchlist_en_posicion(hoja)
-                ws = wb[hoja]
+                    ws = wb[hoja]
+                    sheet_set.add(hoja)
                 _poner_encabezados(ws)
-                ws.append([
-                    ahora.strftime("%d/%m/%Y"),
-                    ahora.strftime("%H:%M:%S"),
-                    nombre,
-                    tiempo_mmss or "",
-                    int(tiempo_seg) if isinstance(tiempo_seg, (int, float)) else "",
-                    vel_kmh if vel_kmh is not None else "",
-                    dist_km if dist_km is not None else ""
-                ])
-                u += 1
-                guardados += 1
-
-            elif es_usual is False:
-                # INUSUAL → "Tráfico inusual"
-                hoja_inus.append([
-                    ahora.strftime("%d/%m/%Y"),
-                    ahora.strftime("%H:%M:%S"),
-                    nombre,
-                    tiempo_mmss or "",
-                    int(tiempo_seg) if isinstance(tiempo_seg, (int, float)) else "",
-                    vel_kmh if vel_kmh is not None else "",
-                    dist_km if dist_km is not None else ""
-                ])
-                i += 1
-                guardados += 1
-
-            else:
-                # DESCONOCIDO → creamos/llenamos "Desconocidos" (queda al final)
-                if "Desconocidos" not in wb.sheetnames:
-                    hoja_desc = wb.create_sheet("Desconocidos")
-                    _poner_encabezados(hoja_desc)
-                else:
-                    hoja_desc = wb["Desconocidos"]
-                hoja_desc.append([
-                    ahora.strftime("%d/%m/%Y"),
-                    ahora.strftime("%H:%M:%S"),
-                    nombre,
-                    tiempo_mmss or "",
-                    int(tiempo_seg) if isinstance(tiempo_seg, (int, float)) else "",
-                    vel_kmh if vel_kmh is not None else "",
-                    dist_km if dist_km is not None else ""
-                ])
-                guardados += 1
-
-        except IllegalCharacterError:
-            continue
+                for fila in filas:
+                    try:
+                        ws.append(fila)
+                    except IllegalCharacterError:
+                        continue
+            except Exception:
+                continue
+
+    # Persistencia O(filas nuevas): los shards CSV quedan escritos aunque el
+    # save del .xlsx esté diferido por el lote.
+    if filas_por_hoja:
+        try:
+            _csv_append_shards(filas_por_hoja)
         except Exception:
-            continue
+            pass
 
-    # Reordenar hojas conforme a la política y guardar
-    try:
-        _ordenar_hojas_watchlist()
-        safe_save_workbook(wb, archivo_excel)
-    except Exception:
-        pass
+    # Capturas que no aportaron filas no cuentan para el lote ni disparan
+    # saves; el reorden de hojas ya se salta solo vía _orden_dirty.
+    if guardados == 0:
+        return guardados, u, i
+
+    # Guardado amortizado: solo cada N capturas / M filas (o en recuperación).
+    # El save real corre en el hilo escritor; aquí solo se encola.
+    _capturas_sin_guardar += 1
+    _filas_sin_guardar += guardados
+    if _skip_wal:
+        flush_guardado()
+    elif (_capturas_sin_guardar >= _FLUSH_CADA_CAPTURAS
+            or _filas_sin_guardar >= _FLUSH_MAX_FILAS):
+        solicitar_guardado()
 
     return guardados, u, i
 
@@ -408,8 +656,14 @@ __all__ = [
     "wb",
     "archivo_excel",
     "set_workbook",
+    "recover_from_wal",
     "ruta_log_txt",
     "atomic_save_workbook",
     "safe_save_workbook",
+    "exportar_xlsx",
     "guardar_tramos",
+    "flush_guardado",
+    "solicitar_guardado",
+    "cerrar_guardado_async",
+    "guardado_cerrado",
 ]